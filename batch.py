@@ -0,0 +1,126 @@
+"""
+    Batch solving of many puzzles across a process pool
+"""
+import sys
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from os import cpu_count
+from time import perf_counter
+from typing import Callable, Iterable, Iterator
+from canonical import CanonicalCache
+from sudoku import SolverStats, Sudoku
+
+# Canonical form cache of each worker process, see solve_chunk
+_worker_cache : CanonicalCache | None = None
+
+def solve_one(puzzle: str, full_solve: bool = True, stats: SolverStats | None = None, cache: CanonicalCache | None = None) -> str:
+    """
+        Returns the grid as an 81 char string after deduction (incremental update_while_possible),
+        completed by the exhaustive search when full_solve is set. The techniques are recorded in stats if given.
+        With a cache, puzzles equivalent to an already solved one are not solved again (recorded as CACHE_HIT).
+    """
+    def deduce_and_solve(sudoku: Sudoku):
+        sudoku.update_while_possible(show_grid=False, incremental=True)
+        if full_solve and sudoku.get_empty_cell_count() > 0:
+            sudoku.solve()
+
+    sudoku = Sudoku.from_string(puzzle)
+    sudoku.stats = stats
+    if cache is not None:
+        cache.run(sudoku, f"solve_one:{full_solve}", deduce_and_solve)
+    else:
+        deduce_and_solve(sudoku)
+    return sudoku.to_string()
+
+def solve_chunk(puzzles: list[str], full_solve: bool, with_stats: bool = False, cache_size: int = 0) -> tuple[list[str], SolverStats | None]:
+    global _worker_cache
+    if cache_size > 0 and (_worker_cache is None or _worker_cache.max_size != cache_size):
+        _worker_cache = CanonicalCache(cache_size)
+    stats = SolverStats() if with_stats else None
+    return [solve_one(puzzle, full_solve, stats, _worker_cache if cache_size > 0 else None) for puzzle in puzzles], stats
+
+def iter_puzzles(lines: Iterable[str]) -> Iterator[str]:
+    """
+        One 81 char puzzle per line, blank lines and '#' comments are skipped
+    """
+    for line in lines:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+def read_puzzles(path: str) -> Iterator[str]:
+    """
+        Streams the puzzles of a file, '-' for stdin
+    """
+    if path == "-":
+        yield from iter_puzzles(sys.stdin)
+        return
+    with open(path) as puzzle_file:
+        yield from iter_puzzles(puzzle_file)
+
+def solve_many(puzzles: Iterable[str], workers: int | None = None, chunk_size: int = 256, full_solve: bool = True,
+               report: Callable[[int, float], None] | None = None, stats: SolverStats | None = None, cache_size: int = 0) -> Iterator[str]:
+    """
+        Yields the result of solve_one for each puzzle, in input order
+        Puzzles are sent to the workers by chunks of chunk_size, and at most 2 chunks per worker are in flight,
+        so that the input can be a lazy iterator over a huge file.
+        report(nb_solved, elapsed_seconds) is called after each chunk.
+        The per technique stats of the workers are merged into stats if given.
+        With cache_size > 0 each worker keeps a canonical form cache of that many results (see canonical.py).
+    """
+    workers = workers or cpu_count() or 1
+    puzzles_it = iter(puzzles)
+    start = perf_counter()
+    nb_solved = 0
+
+    if workers == 1:
+        for chunk in iter(lambda: list(islice(puzzles_it, chunk_size)), []):
+            results, chunk_stats = solve_chunk(chunk, full_solve, stats is not None, cache_size)
+            if chunk_stats is not None:
+                stats.merge(chunk_stats)
+            yield from results
+            nb_solved += len(chunk)
+            if report is not None:
+                report(nb_solved, perf_counter() - start)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        pending : deque[Future] = deque()
+        chunks = iter(lambda: list(islice(puzzles_it, chunk_size)), [])
+        for chunk in islice(chunks, 2 * workers):
+            pending.append(executor.submit(solve_chunk, chunk, full_solve, stats is not None, cache_size))
+        while pending:
+            results, chunk_stats = pending.popleft().result()
+            if chunk_stats is not None:
+                stats.merge(chunk_stats)
+            for chunk in islice(chunks, 1):
+                pending.append(executor.submit(solve_chunk, chunk, full_solve, stats is not None, cache_size))
+            yield from results
+            nb_solved += len(results)
+            if report is not None:
+                report(nb_solved, perf_counter() - start)
+
+def print_report(nb_solved: int, elapsed: float):
+    print(f"\r{nb_solved} puzzles in {elapsed:.2f}s ({nb_solved / max(elapsed, 1e-9):.0f} puzzles/s)", end="", file=sys.stderr)
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Solve a file of puzzles (one 81 char puzzle per line)")
+    parser.add_argument("puzzles", help="Puzzle file, '-' for stdin")
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("-c", "--chunk-size", type=int, default=256)
+    parser.add_argument("--deduction-only", action="store_true", help="Stop after update_while_possible")
+    parser.add_argument("--stats", metavar="STATS_JSON", help="Write the per technique calls, cells resolved and time spent")
+    parser.add_argument("--cache-size", type=int, default=0, help="Results kept per worker, to solve repeated and isomorphic puzzles once")
+    args = parser.parse_args()
+
+    puzzles = read_puzzles(args.puzzles)
+    stats = SolverStats() if args.stats else None
+    for result in solve_many(puzzles, args.workers, args.chunk_size, not args.deduction_only, print_report, stats, args.cache_size):
+        print(result)
+    print(file=sys.stderr)
+    if stats is not None:
+        print(stats, file=sys.stderr)
+        with open(args.stats, "w") as stats_file:
+            stats_file.write(stats.to_json())
@@ -0,0 +1,172 @@
+"""
+    Benchmarks of the Sudoku deduction hot paths on fixed corpora, with JSON baselines to catch regressions
+"""
+import json
+import sys
+import tracemalloc
+from argparse import ArgumentParser
+from statistics import mean, quantiles
+from time import perf_counter
+from typing import Callable
+from sudoku import Sudoku
+
+CORPORA : dict[str, list[str]] = {
+    "easy": [
+        "003020600900305001001806400008102900700000008006708200002609500800203009005010300",
+        "200080300060070084030500209000105408000000000402706000301007040720040060004010003",
+        "000000907000420180000705026100904000050000040000507009920108000034059000507000000",
+        "030050040008010500460000012070502080000603000040109030250000098001020600080060020",
+    ],
+    "medium": [
+        "001000700000010485840600030500190000003500006000000500059300640180720003300000000",
+        "000000039000001005003050800008090006070002000100400000009080050020000600400700000",
+        "000003017015009008060000000100007000009000200000500004000000020500600340340200000",
+        "100007090030020008009600500005300900010080002600004000300000010040000007007000300",
+    ],
+    "hard": [
+        "800000000003600000070090200050007000000045700000100030001000068008500010090000400",
+        "400000805030000000000700000020000060000080400000010000000603070500200000104000000",
+        "520006000000000701300000000000400800600000050000000000041800000000030020008700000",
+        "600000803040700000000000000000504070300200000106000000020000050000080600000010000",
+        "480300000000000071020000000705000060000200800000000000001076000300000400000050000",
+        "000014000030000200070000000000900030601000000000000080200000104000050600000708000",
+    ],
+    "17-clue": [
+        "000000010400000000020000000000050407008000300001090000300400200050100000000806000",
+        "000000012000035000000600070700000300000400800100000000000120000080000040050000600",
+        "000000012003600000000007000410020000000500300700000600280000040000300500000000000",
+        "000000012008030000000000040120500000000004700060000000507000300000620000000100000",
+        "000000013000030080070000000000206000030000900000010000600500204000400700100000000",
+    ],
+}
+
+def bench_get_allowed_values(puzzle: str) -> list[float]:
+    sudoku = Sudoku.from_string(puzzle)
+    latencies : list[float] = []
+    for row_id in range(9):
+        for col_id in [c_id for c_id in range(9) if sudoku.grid[row_id][c_id] == 0]:
+            start = perf_counter()
+            sudoku.get_allowed_values(row_id, col_id)
+            latencies.append(perf_counter() - start)
+    return latencies
+
+def bench_build_extrapolation_grid(puzzle: str) -> list[float]:
+    sudoku = Sudoku.from_string(puzzle)
+    latencies : list[float] = []
+    for val in range(1, 10):
+        start = perf_counter()
+        sudoku.build_extrapolation_grid(val)
+        latencies.append(perf_counter() - start)
+    return latencies
+
+def bench_full_update(puzzle: str) -> list[float]:
+    sudoku = Sudoku.from_string(puzzle)
+    start = perf_counter()
+    sudoku.full_update()
+    return [perf_counter() - start]
+
+def bench_update_while_possible(puzzle: str) -> list[float]:
+    sudoku = Sudoku.from_string(puzzle)
+    start = perf_counter()
+    sudoku.update_while_possible(show_grid=False)
+    return [perf_counter() - start]
+
+def bench_update_while_possible_incremental(puzzle: str) -> list[float]:
+    sudoku = Sudoku.from_string(puzzle)
+    start = perf_counter()
+    sudoku.update_while_possible(show_grid=False, incremental=True)
+    return [perf_counter() - start]
+
+def bench_solve(puzzle: str) -> list[float]:
+    sudoku = Sudoku.from_string(puzzle)
+    start = perf_counter()
+    sudoku.solve()
+    return [perf_counter() - start]
+
+# name -> (benchmark returning the latency of each call on a puzzle, whether a call handles a whole puzzle)
+BENCHMARKS : dict[str, tuple[Callable[[str], list[float]], bool]] = {
+    "get_allowed_values": (bench_get_allowed_values, False),
+    "build_extrapolation_grid": (bench_build_extrapolation_grid, False),
+    "full_update": (bench_full_update, True),
+    "update_while_possible": (bench_update_while_possible, True),
+    "update_while_possible_incremental": (bench_update_while_possible_incremental, True),
+    "solve": (bench_solve, True),
+}
+
+def run_benchmark(benchmark: Callable[[str], list[float]], per_puzzle: bool, puzzles: list[str], repeat: int) -> dict[str, float]:
+    latencies : list[float] = []
+    for _ in range(repeat):
+        for puzzle in puzzles:
+            latencies.extend(benchmark(puzzle))
+    percentiles = quantiles(latencies, n=100, method="inclusive") if len(latencies) > 1 else [latencies[0]] * 99
+    result = {
+        "calls": len(latencies),
+        "mean_us": mean(latencies) * 1e6,
+        "p50_us": percentiles[49] * 1e6,
+        "p90_us": percentiles[89] * 1e6,
+        "p99_us": percentiles[98] * 1e6,
+    }
+    if per_puzzle:
+        result["puzzles_per_s"] = len(latencies) / sum(latencies)
+
+    # Peak memory on a separate pass, tracemalloc slows the timed calls down
+    tracemalloc.start()
+    for puzzle in puzzles:
+        benchmark(puzzle)
+    result["peak_kib"] = tracemalloc.get_traced_memory()[1] / 1024
+    tracemalloc.stop()
+    return result
+
+def run_benchmarks(repeat: int = 5, names: list[str] | None = None, corpora: list[str] | None = None) -> dict[str, dict[str, dict[str, float]]]:
+    """
+        results[benchmark][corpus][metric]
+    """
+    results : dict[str, dict[str, dict[str, float]]] = {}
+    for name in names or list(BENCHMARKS):
+        benchmark, per_puzzle = BENCHMARKS[name]
+        results[name] = {corpus: run_benchmark(benchmark, per_puzzle, CORPORA[corpus], repeat) for corpus in corpora or list(CORPORA)}
+    return results
+
+def find_regressions(results: dict, baseline: dict, tolerance: float = 0.2) -> list[str]:
+    """
+        Benchmarks whose median latency or peak memory grew by more than tolerance since the baseline
+    """
+    regressions : list[str] = []
+    for name, by_corpus in results.items():
+        for corpus, metrics in by_corpus.items():
+            baseline_metrics = baseline.get(name, {}).get(corpus)
+            if baseline_metrics is None:
+                continue
+            for metric in ("p50_us", "peak_kib"):
+                if metrics[metric] > baseline_metrics[metric] * (1 + tolerance):
+                    regressions.append(f"{name}[{corpus}] {metric}: {baseline_metrics[metric]:.1f} -> {metrics[metric]:.1f}")
+    return regressions
+
+def print_results(results: dict):
+    print(f"{'benchmark':<36}{'corpus':<10}{'p50 us':>10}{'p90 us':>10}{'p99 us':>10}{'puzzles/s':>11}{'peak KiB':>10}")
+    for name, by_corpus in results.items():
+        for corpus, metrics in by_corpus.items():
+            puzzles_per_s = f"{metrics['puzzles_per_s']:.0f}" if "puzzles_per_s" in metrics else "-"
+            print(f"{name:<36}{corpus:<10}{metrics['p50_us']:>10.1f}{metrics['p90_us']:>10.1f}{metrics['p99_us']:>10.1f}{puzzles_per_s:>11}{metrics['peak_kib']:>10.1f}")
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the Sudoku deduction routines")
+    parser.add_argument("-r", "--repeat", type=int, default=5)
+    parser.add_argument("-b", "--benchmark", action="append", choices=list(BENCHMARKS), help="Default: all")
+    parser.add_argument("-c", "--corpus", action="append", choices=list(CORPORA), help="Default: all")
+    parser.add_argument("--save", metavar="BASELINE_JSON", help="Store the results as a baseline")
+    parser.add_argument("--compare", metavar="BASELINE_JSON", help="Exit with 1 if a benchmark regressed since this baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.repeat, args.benchmark, args.corpus)
+    print_results(results)
+    if args.save:
+        with open(args.save, "w") as baseline_file:
+            json.dump(results, baseline_file, indent=2)
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = find_regressions(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        sys.exit(1 if regressions else 0)
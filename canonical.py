@@ -0,0 +1,284 @@
+"""
+    Canonical form of Sudoku grids under the symmetry group (digit relabelling, row and column permutations
+    within bands and stacks, band and stack permutations, transposition), and a bounded LRU cache of the
+    deduction / solve results, so that repeated and isomorphic puzzles are only solved once
+"""
+from collections import Counter, OrderedDict
+from functools import lru_cache
+from itertools import permutations, product
+from time import perf_counter
+from typing import Callable, NamedTuple
+from sudoku import Sudoku, ROWS, COLS, UNITS, CACHE_HIT
+
+# Past this many candidates tying for the smallest prefix (sparse grids), canonicalize gives up
+MAX_CANDIDATES : int = 4096
+TRANSPOSED_CELL_IDS : tuple[int, ...] = tuple(9 * (cell_id % 9) + cell_id // 9 for cell_id in range(81))
+
+@lru_cache(maxsize=None)
+def get_first_row_orders(filled_mask: int) -> tuple[tuple[int, ...], ...]:
+    """
+        Column orders putting the filled cells of a row (bit col_id of filled_mask) as far right as possible
+        The values of a valid row are distinct, so its relabelled row only depends on where its filled cells go:
+        the stacks come by increasing number of filled cells, and the empty cells first in each stack.
+    """
+    stacks = [[col_id for col_id in range(3 * stack_id, 3 * stack_id + 3)] for stack_id in range(3)]
+    nb_filled = [sum(filled_mask >> col_id & 1 for col_id in stack) for stack in stacks]
+    stack_orders = [order for order in permutations(range(3)) if nb_filled[order[0]] <= nb_filled[order[1]] <= nb_filled[order[2]]]
+    stack_col_orders = [
+        [empty_cols + filled_cols
+         for empty_cols in permutations([col_id for col_id in stack if not filled_mask >> col_id & 1])
+         for filled_cols in permutations([col_id for col_id in stack if filled_mask >> col_id & 1])]
+        for stack in stacks
+    ]
+    return tuple(
+        tuple(col_id for stack_cols in col_orders for col_id in stack_cols)
+        for stack_order in stack_orders
+        for col_orders in product(*[stack_col_orders[stack_id] for stack_id in stack_order])
+    )
+
+class Symmetry(NamedTuple):
+    """
+        canonical[9 * row_id + col_id] = relabel[cells[9 * rows[row_id] + cols[col_id]]], cells being transposed first if transposed
+    """
+    transposed : bool
+    rows : tuple[int, ...]
+    cols : tuple[int, ...]
+    relabel : bytes                 # translate table, 0 -> 0 and a permutation of 1..9
+
+    def apply(self, cells: bytes | bytearray | memoryview) -> bytes:
+        cells = bytes(cells)
+        if self.transposed:
+            cells = bytes(cells[cell_id] for cell_id in TRANSPOSED_CELL_IDS)
+        return bytes(cells[9 * row_id + col_id] for row_id in self.rows for col_id in self.cols).translate(self.relabel)
+
+    def invert(self, canonical: bytes | bytearray | memoryview) -> bytes:
+        unlabel = bytearray(range(256))
+        for val in range(10):
+            unlabel[self.relabel[val]] = val
+        canonical = bytes(canonical).translate(unlabel)
+        cells = bytearray(81)
+        for row_pos, row_id in enumerate(self.rows):
+            for col_pos, col_id in enumerate(self.cols):
+                cells[9 * row_id + col_id] = canonical[9 * row_pos + col_pos]
+        if self.transposed:
+            cells = bytearray(cells[cell_id] for cell_id in TRANSPOSED_CELL_IDS)
+        return bytes(cells)
+
+class _Candidate(NamedTuple):
+    transposed : bool
+    cells : bytes
+    cols : tuple[int, ...]
+    rows : tuple[int, ...]
+    relabel : tuple[int, ...]       # relabel[val], 0 while val has not been met
+    nb_labels : int
+
+def _relabel_row(candidate: _Candidate, row_id: int) -> tuple[tuple[int, ...], tuple[int, ...], int]:
+    """
+        (relabelled row, updated relabel, updated nb_labels), new values get the next labels in reading order
+    """
+    relabel = list(candidate.relabel)
+    nb_labels = candidate.nb_labels
+    row : list[int] = []
+    for col_id in candidate.cols:
+        val = candidate.cells[9 * row_id + col_id]
+        if val > 0 and relabel[val] == 0:
+            nb_labels += 1
+            relabel[val] = nb_labels
+        row.append(relabel[val])
+    return tuple(row), tuple(relabel), nb_labels
+
+def is_valid(cells: bytes | bytearray | memoryview) -> bool:
+    """
+        No value twice in a unit
+    """
+    for unit in UNITS:
+        vals = [cells[cell_id] for cell_id in unit if cells[cell_id] > 0]
+        if len(set(vals)) != len(vals):
+            return False
+    return True
+
+def get_invariant(cells: bytes | bytearray | memoryview) -> tuple:
+    """
+        Cheap key equal for all the grids of an equivalence class (and possibly for some others): the numbers of
+        filled cells of the segments of each line, sorted within the lines, the bands and the stacks, and the sorted
+        numbers of cells of each value
+    """
+    def get_lines_signature(lines: tuple[tuple[int, ...], ...]) -> tuple:
+        line_signatures = [
+            tuple(sorted(sum(1 for cell_id in line[3 * segment_id:3 * segment_id + 3] if cells[cell_id] > 0) for segment_id in range(3)))
+            for line in lines
+        ]
+        return tuple(sorted(tuple(sorted(line_signatures[3 * band_id:3 * band_id + 3])) for band_id in range(3)))
+
+    rows_signature, cols_signature = get_lines_signature(ROWS), get_lines_signature(COLS)
+    return (min(rows_signature, cols_signature), max(rows_signature, cols_signature), tuple(sorted(Counter(val for val in cells if val > 0).values())))
+
+def canonicalize(cells: bytes | bytearray | memoryview, max_candidates: int = MAX_CANDIDATES) -> tuple[bytes, Symmetry] | None:
+    """
+        Returns (canonical cells, symmetry mapping cells to them). The canonical form is the lexicographically
+        smallest image of the grid (empty cells first), equal for all the grids of an equivalence class.
+        It is built row by row, keeping only the candidates (transposition, column order, rows so far) that give
+        the smallest prefix. Only the 9 x 9 boards are handled.
+        Returns None for invalid grids, and when more than max_candidates candidates tie, which only happens
+        on sparse grids (an empty row alone gives 1296 of them).
+    """
+    assert len(cells) == 81, f"Only the 9 x 9 boards have a canonical form, got {len(cells)} cells"
+    cells = bytes(cells)
+    if not is_valid(cells):
+        return None
+    # First row: only the column orders giving the smallest row
+    candidates : list[_Candidate] = []
+    best_row : tuple[int, ...] | None = None
+    for transposed, grid in ((False, cells), (True, bytes(cells[cell_id] for cell_id in TRANSPOSED_CELL_IDS))):
+        for row_id in range(9):
+            for cols in get_first_row_orders(sum(1 << col_id for col_id in range(9) if grid[9 * row_id + col_id] > 0)):
+                candidate = _Candidate(transposed, grid, cols, (), (0,) * 10, 0)
+                row, relabel, nb_labels = _relabel_row(candidate, row_id)
+                if best_row is not None and row > best_row:
+                    continue
+                if best_row is None or row < best_row:
+                    best_row = row
+                    candidates = []
+                candidates.append(candidate._replace(rows=(row_id,), relabel=relabel, nb_labels=nb_labels))
+                if len(candidates) > max_candidates:
+                    return None
+    canonical = bytearray(best_row)
+    for row_pos in range(1, 9):
+        best_row : tuple[int, ...] | None = None
+        next_candidates : list[_Candidate] = []
+        for candidate in candidates:
+            if row_pos % 3 == 0:
+                used_bands = {row_id // 3 for row_id in candidate.rows}
+                row_ids = [row_id for row_id in range(9) if row_id // 3 not in used_bands]
+            else:
+                band_id = candidate.rows[-1] // 3
+                row_ids = [row_id for row_id in range(3 * band_id, 3 * band_id + 3) if row_id not in candidate.rows]
+            for row_id in row_ids:
+                row, relabel, nb_labels = _relabel_row(candidate, row_id)
+                if best_row is not None and row > best_row:
+                    continue
+                if best_row is None or row < best_row:
+                    best_row = row
+                    next_candidates = []
+                next_candidates.append(candidate._replace(rows=candidate.rows + (row_id,), relabel=relabel, nb_labels=nb_labels))
+                if len(next_candidates) > max_candidates:
+                    return None
+        canonical.extend(best_row)
+        candidates = next_candidates
+
+    best = candidates[0]
+    # Values missing from the grid get the remaining labels in increasing order, so that relabel is a permutation
+    relabel = list(best.relabel)
+    missing_labels = iter(range(best.nb_labels + 1, 10))
+    for val in range(1, 10):
+        if relabel[val] == 0:
+            relabel[val] = next(missing_labels)
+    return bytes(canonical), Symmetry(best.transposed, best.rows, best.cols, bytes(relabel) + bytes(range(10, 256)))
+
+class _Entry:
+    """
+        A grid of the cache, its canonical form being only computed when another grid gets the same invariant
+    """
+    __slots__ = ("cells", "result_cells", "result", "seconds", "canonical_form", "is_canonicalized")
+
+    def __init__(self, cells: bytes, result_cells: bytes, result: int | None, seconds: float):
+        self.cells = cells
+        self.result_cells = result_cells
+        self.result = result
+        self.seconds = seconds                                          # Time compute took on it
+        self.canonical_form : tuple[bytes, Symmetry] | None = None
+        self.is_canonicalized = False
+
+    def get_canonical_form(self) -> tuple[bytes, Symmetry] | None:
+        if not self.is_canonicalized:
+            self.canonical_form = canonicalize(self.cells)
+            self.is_canonicalized = True
+        return self.canonical_form
+
+class CanonicalCache:
+    """
+        Bounded LRU cache: (kind, invariant) -> entries of the grids with that invariant (see get_invariant)
+        A grid already in the cache is found by comparing the cells. Grids are only canonicalized when their
+        invariant matches an entry whose computation took at least min_compute_seconds, since canonicalize takes
+        a few ms, more than a deduction or the solve of an easy puzzle.
+    """
+    def __init__(self, max_size: int = 4096, min_compute_seconds: float = 0.005):
+        self.max_size = max_size
+        self.min_compute_seconds = min_compute_seconds
+        self.entries : OrderedDict[tuple[str, tuple], list[_Entry]] = OrderedDict()
+        self.nb_entries : int = 0
+        self.hits : int = 0
+        self.misses : int = 0
+
+    def __len__(self) -> int:
+        return self.nb_entries
+
+    def find(self, entries: list[_Entry], cells: bytes) -> tuple[bytes, int | None] | None:
+        """
+            (result cells, result) of cells from the entries of its invariant, None if it is not in the cache
+        """
+        for entry in entries:
+            if entry.cells == cells:
+                return entry.result_cells, entry.result
+        slow_entries = [entry for entry in entries if entry.seconds >= self.min_compute_seconds]
+        if not slow_entries:
+            return None
+        canonical_form = canonicalize(cells)
+        if canonical_form is None:
+            return None
+        canonical, symmetry = canonical_form
+        for entry in slow_entries:
+            entry_canonical_form = entry.get_canonical_form()
+            if entry_canonical_form is not None and entry_canonical_form[0] == canonical:
+                return symmetry.invert(entry_canonical_form[1].apply(entry.result_cells)), entry.result
+        return None
+
+    def run(self, sudoku: Sudoku, kind: str, compute: Callable[[Sudoku], int | None]) -> int | None:
+        """
+            Applies compute to sudoku, or copies the grid it gave on the same or an equivalent grid back through the symmetry
+            kind tells apart the computations cached together, compute returns the result cached with the grid
+            The boards other than 9 x 9 have no canonical form and are always computed.
+            A hit is recorded in sudoku.stats as CACHE_HIT (the techniques compute would have used are not recorded).
+        """
+        if sudoku.size != 9:
+            return compute(sudoku)
+        cells = bytes(sudoku.cells)
+        key = (kind, get_invariant(cells))
+        entries = self.entries.get(key)
+        if entries is not None:
+            start = perf_counter()
+            self.entries.move_to_end(key)
+            found = self.find(entries, cells)
+            if found is not None:
+                self.hits += 1
+                result_cells, result = found
+                nb_resolved = 0
+                for cell_id, val in enumerate(result_cells):
+                    if val != sudoku.cells[cell_id]:
+                        sudoku.set_value(cell_id // 9, cell_id % 9, val)
+                        nb_resolved += 1
+                if sudoku.stats is not None:
+                    sudoku.stats.record(CACHE_HIT, nb_resolved, perf_counter() - start)
+                return result
+        self.misses += 1
+        start = perf_counter()
+        result = compute(sudoku)
+        entry = _Entry(cells, bytes(sudoku.cells), result, perf_counter() - start)
+        if entries is None:
+            entries = self.entries[key] = []
+        entries.append(entry)
+        self.nb_entries += 1
+        while self.nb_entries > self.max_size:
+            _, evicted_entries = self.entries.popitem(last=False)
+            self.nb_entries -= len(evicted_entries)
+        return result
+
+    def update_while_possible(self, sudoku: Sudoku, incremental: bool = True, use_stuck_position: bool = True):
+        self.run(sudoku, f"update_while_possible:{use_stuck_position}",
+                 lambda sudoku: sudoku.update_while_possible(show_grid=False, incremental=incremental, use_stuck_position=use_stuck_position))
+
+    def full_update(self, sudoku: Sudoku) -> bool:
+        return bool(self.run(sudoku, "full_update", Sudoku.full_update))
+
+    def solve(self, sudoku: Sudoku) -> int:
+        return self.run(sudoku, "solve", Sudoku.solve)
@@ -2,7 +2,14 @@
     Main function
 """
 from manim import *
-from sudoku import Sudoku
+import os
+import subprocess
+import tempfile
+from itertools import groupby
+from typing import Callable
+from sudoku import Sudoku, Step, get_geometry, ALLOWED, COVER, EXTRAPOLATION, ELIMINATION, VALUES_TO_DIGITS
+from render_plan import Segment, build_render_plan, get_default_run_time, VISIT_TIME, WRITE_TIME
+from render_cache import RenderCache
 
 GRID : list[list[int]] = [\
     [int(s) for s in "001000700"],
@@ -18,343 +25,452 @@ GRID : list[list[int]] = [\
 ]
 
 SUDOKU = Sudoku(GRID)
-
-def get_pos_in_grid_from_rowid_colid(row_id: int, col_id: int):
-    return 3*LEFT + 0.75 * RIGHT * col_id + 3*UP + 0.75 * DOWN * row_id
-
-def get_pos_in_dgrid_from_rowid_colid(row_id: int, col_id: int):
-    nb_sauts_col = col_id // 3
-    h_pos = 6.75*LEFT + (col_id + nb_sauts_col) * 0.25 * RIGHT
-    nb_sauts_row = row_id // 3
-    v_pos = 1.25 * UP + (row_id + nb_sauts_row) * 0.25 * DOWN
+# Solving steps, recorded once on a copy of the grid, the scenes below only replay them
+TRACE : list[Step] = Sudoku(GRID).record_trace()
+# Render budget of MainSudoku, None for one segment per step / the uncompressed duration
+MAX_SEGMENTS : int | None = 200
+TARGET_DURATION : float | None = None
+
+# Style of the video, part of the render cache keys, the sizes are those of the 9 x 9 board and are scaled
+# for the other boards so that the grids keep the same place on screen
+GRID_CELL_SIZE : float = 0.75
+DGRID_CELL_SIZE : float = 0.25
+DIGIT_SCALE : float = 0.5
+
+def get_style() -> dict:
+    return {
+        "grid_cell_size": GRID_CELL_SIZE,
+        "dgrid_cell_size": DGRID_CELL_SIZE,
+        "digit_scale": DIGIT_SCALE,
+        "pixel_width": config.pixel_width,
+        "pixel_height": config.pixel_height,
+        "frame_rate": config.frame_rate,
+        "background_color": config.background_color,
+    }
+
+def get_grid_cell_size(size: int = 9) -> float:
+    return GRID_CELL_SIZE * 9 / size
+
+def get_pos_in_grid_from_rowid_colid(row_id: int, col_id: int, size: int = 9):
+    cell_size = get_grid_cell_size(size)
+    half_width = 4.5 * GRID_CELL_SIZE - cell_size / 2
+    return half_width * LEFT + cell_size * RIGHT * col_id + half_width * UP + cell_size * DOWN * row_id
+
+def get_dgrid_cell_size(size: int = 9) -> float:
+    """
+        Spacing of the squares of the detection grid, a bloc of box_size squares keeps the width of 4 squares of the 9 x 9 board
+    """
+    box_size = get_geometry(size).box_size
+    return DGRID_CELL_SIZE * 4 / (box_size + 1) * 3 / box_size
+
+def get_pos_in_dgrid_from_rowid_colid(row_id: int, col_id: int, size: int = 9):
+    box_size = get_geometry(size).box_size
+    dcell_size = get_dgrid_cell_size(size)
+    bloc_width = (box_size + 1) * dcell_size
+    h_pos = 7 * LEFT + ((col_id // box_size) * bloc_width + (col_id % box_size + 1) * dcell_size) * RIGHT
+    v_pos = 1.5 * UP + ((row_id // box_size) * bloc_width + (row_id % box_size + 1) * dcell_size) * DOWN
     return h_pos + v_pos
 
+# (val, color, size) -> prototype of the digit, laid out once by Pango and copied afterwards
+DIGIT_TXTS : dict[tuple[int, str, int], Text] = {}
+
+def get_digit_txt(val: int, row_id: int, col_id: int, color = WHITE, size: int = 9) -> Text:
+    """
+        Copy of the cached digit mobject (1-9 then A-Z, as in the puzzle strings), placed in the main grid
+    """
+    if (val, color, size) not in DIGIT_TXTS:
+        DIGIT_TXTS[(val, color, size)] = Text(chr(VALUES_TO_DIGITS[val]), color = color).scale(DIGIT_SCALE * 9 / size)
+    return DIGIT_TXTS[(val, color, size)].copy().move_to(get_pos_in_grid_from_rowid_colid(row_id, col_id, size))
+
+def build_dgrid_squares(size: int = 9) -> VGroup:
+    """
+        Pool of the size * size small squares of the detection grid, hidden until a phase shows them
+    """
+    side_length = 0.8 * get_dgrid_cell_size(size)
+    return VGroup(*[
+        Square(side_length = side_length).move_to(get_pos_in_dgrid_from_rowid_colid(row_id, col_id, size)).set_fill(WHITE, 0.0).set_stroke(opacity = 0.0)
+        for row_id in range(size) for col_id in range(size)
+    ])
+
+def get_dgrid_squares(scene: Scene, size: int = 9) -> VGroup:
+    if not hasattr(scene, "dgrid_squares"):
+        scene.dgrid_squares = build_dgrid_squares(size)
+        scene.add(scene.dgrid_squares)
+    return scene.dgrid_squares
+
+def show_dgrid_squares(dgrid_squares: VGroup, cell_ids: list[int], color = WHITE) -> VGroup:
+    """
+        Shows the squares of cell_ids as a single VGroup update
+    """
+    return VGroup(*[dgrid_squares[cell_id] for cell_id in cell_ids]).set_fill(color, 1.0).set_stroke(opacity = 1.0)
+
+def hide_dgrid_squares(dgrid_squares: VGroup) -> VGroup:
+    return dgrid_squares.set_fill(WHITE, 0.0).set_stroke(opacity = 0.0)
+
+def build_background_lines(size: int = 9) -> list[Line]:
+    hlines : list[Line] = []
+    vlines : list[Line] = []
+    box_size = get_geometry(size).box_size
+    half_width = 4.5 * GRID_CELL_SIZE
+    delta = -half_width
+    for _ in range(box_size + 1):
+        hlines.append(Line(start = half_width * LEFT + delta * DOWN, end = half_width * RIGHT + delta * DOWN))
+        vlines.append(Line(start = half_width * UP + delta * RIGHT, end = half_width * DOWN + delta * RIGHT))
+        delta += 2 * half_width / box_size
+    return hlines + vlines
+
+def build_dgrid_background_lines(size: int = 9) -> list[Line]:
+    lines = []
+    box_size = get_geometry(size).box_size
+    bloc_width = 3 / box_size
+    for i in range(box_size + 1):
+        lines.append(Line(start = (4 + i * bloc_width) * LEFT + 1.5 * UP, end = (4 + i * bloc_width) * LEFT + 1.5 * DOWN))
+        lines.append(Line(start = 7 * LEFT + (1.5 - i * bloc_width) * UP, end = 4 * LEFT + (i * bloc_width - 1.5)* DOWN))
+    return lines
+
+def add_grid_digits(scene: Scene, sudoku: Sudoku):
+    size = sudoku.size
+    scene.add(*[get_digit_txt(val, cell_id // size, cell_id % size, size = size) for cell_id, val in enumerate(sudoku.cells) if val > 0])
+
 class BuildBackground(Scene):
-    def construct(self):
-        hlines : list[Line] = []
-        vlines : list[Line] = []
-        delta = -3.375
-        for _ in range(4):
-            hlines.append(Line(start = 3.375 * LEFT + delta * DOWN, end = 3.375 * RIGHT + delta * DOWN))
-            vlines.append(Line(start = 3.375 * UP + delta * RIGHT, end = 3.375 * DOWN + delta * RIGHT))
-            delta += 2.25
-        self.play(*[Create(line) for line in hlines + vlines])
+    def construct(self, size : int = 9):
+        self.play(*[Create(line) for line in build_background_lines(size)])
         self.wait()
 
 class BuildDGridBackground(Scene):
-    def construct(self):
-        lines = []
-        for i in range(4):
-            lines.append(Line(start = (4 + i) * LEFT + 1.5 * UP, end = (4 + i) * LEFT + 1.5 * DOWN))
-            lines.append(Line(start = 7 * LEFT + (1.5 - i) * UP, end = 4 * LEFT + (i - 1.5)* DOWN))
-            
-        self.play(*[Create(line) for line in lines])
+    def construct(self, size : int = 9):
+        self.play(*[Create(line) for line in build_dgrid_background_lines(size)])
+        get_dgrid_squares(self, size)
 
 class InitGrid(Scene):
-    def construct(self):
+    def construct(self, sudoku : Sudoku | None = None):
+        sudoku = sudoku or SUDOKU
+        size = sudoku.size
         vals_txts : list[Text] = []
-        for row_id in range(9):
-            for col_id in [c_id for c_id in range(9) if SUDOKU.grid[row_id][c_id] > 0]:
-                pos_in_grid = get_pos_in_grid_from_rowid_colid(row_id, col_id)
-                val_txt = Text(str(SUDOKU.grid[row_id][col_id])).scale(0.5).move_to(pos_in_grid)
+        for row_id in range(size):
+            for col_id in [c_id for c_id in range(size) if sudoku.grid[row_id][c_id] > 0]:
+                val_txt = get_digit_txt(sudoku.grid[row_id][col_id], row_id, col_id, size = size)
                 vals_txts.append(val_txt)
         self.play(*[Write(val_txt) for val_txt in vals_txts])
         self.wait()
 
 class CheckIfIsEmpty(Scene):
-    def construct(self):
-        square = Square(side_length = 0.5, color = WHITE).move_to(get_pos_in_grid_from_rowid_colid(0, 0))
+    def construct(self, sudoku : Sudoku | None = None):
+        sudoku = sudoku or SUDOKU
+        size = sudoku.size
+        square = Square(side_length = 2 / 3 * get_grid_cell_size(size), color = WHITE).move_to(get_pos_in_grid_from_rowid_colid(0, 0, size))
         self.play(Create(square))
-        for row_id in range(9):
-            for col_id in range(9):
-                pos_in_grid = get_pos_in_grid_from_rowid_colid(row_id, col_id)
-                if SUDOKU.grid[row_id][col_id] == 0:
-                    square.set_color(GREEN)
-                else:
-                    square.set_color(RED)
-                square.move_to(pos_in_grid)
-                self.wait(0.25)
+        self.play(
+            Succession(*[
+                square.animate.move_to(get_pos_in_grid_from_rowid_colid(row_id, col_id, size)).set_color(GREEN if sudoku.grid[row_id][col_id] == 0 else RED)
+                for row_id in range(size) for col_id in range(size)
+            ]),
+            run_time = size * size * VISIT_TIME
+        )
 
 class UpdatesFromAllowed(Scene):
-    def construct(self):
-        global SUDOKU
-        square = Square(side_length = 0.5, color = WHITE)
-        square_has_been_added = False
+    def construct(self, segments : list[Segment] | None = None, sudoku : Sudoku | None = None):
+        """
+            Replays segments of ALLOWED steps on sudoku, by default all the allowed values steps of TRACE on a fresh grid
+            Each segment is a single self.play: the square moves to the last visited cell while the values found are written
+        """
+        sudoku = sudoku or Sudoku(GRID)
+        if segments is None:
+            segments = [segment for segment in build_render_plan(TRACE, MAX_SEGMENTS, TARGET_DURATION) if segment.technique_pass == ALLOWED]
+        size = sudoku.size
+        square = Square(side_length = 2 / 3 * get_grid_cell_size(size), color = WHITE)
         updates_from_allowed : list[tuple[int, int, int]] = []
         txt_updates : list[Text] = []
-        
-        for row_id in range(9):
-            for col_id in [c_id for c_id in range(9) if SUDOKU.grid[row_id][c_id] == 0]:
-                pos_in_grid = get_pos_in_grid_from_rowid_colid(row_id, col_id)
-                square.move_to(pos_in_grid)
-                if not square_has_been_added:
-                    self.play(Create(square))
-                    square_has_been_added = True
-                # IN_GRID, EST-CE QUE TU BZ
-                square.move_to(pos_in_grid)
-                
-                if SUDOKU.grid[row_id][col_id] == 0:
-                    annotated_vals = SUDOKU.get_allowed_values(row_id, col_id)
-                    if len(annotated_vals) == 1:
-                        square.set_color(TEAL)
-                        val = annotated_vals[0]
-                        SUDOKU.grid[row_id][col_id] = val
-                        new_upd_txt = Text(str(val)).scale(0.5).set_color(TEAL).move_to(pos_in_grid)
-                        txt_updates.append(new_upd_txt)
-                        self.play(Write(new_upd_txt))
-                        updates_from_allowed.append((row_id, col_id, val))
-                        square.set_color(WHITE)
-                    self.wait(0.25)
+        segments = [segment for segment in segments if segment.steps]
+
+        if segments:
+            square.move_to(get_pos_in_grid_from_rowid_colid(segments[0].steps[0].row_id, segments[0].steps[0].col_id, size))
+
+        for segment_id, segment in enumerate(segments):
+            new_upd_txts : list[Text] = []
+            for step in [step for step in segment.steps if step.val > 0]:
+                sudoku.grid[step.row_id][step.col_id] = step.val
+                new_upd_txts.append(get_digit_txt(step.val, step.row_id, step.col_id, TEAL, size))
+                updates_from_allowed.append((step.row_id, step.col_id, step.val))
+            txt_updates.extend(new_upd_txts)
+
+            last_step = segment.steps[-1]
+            animations = [square.animate.move_to(get_pos_in_grid_from_rowid_colid(last_step.row_id, last_step.col_id, size))]
+            if new_upd_txts:
+                animations.append(LaggedStart(*[Write(new_upd_txt) for new_upd_txt in new_upd_txts]))
+            # The square is created by the first play and removed by the last one, so that each segment is a single play
+            segment_animations : list[Animation] = [AnimationGroup(*animations, run_time = get_default_run_time(segment.steps))]
+            if segment_id == 0:
+                segment_animations.insert(0, Create(square, run_time = VISIT_TIME))
+            if segment_id == len(segments) - 1:
+                segment_animations.append(Uncreate(square, run_time = VISIT_TIME))
+            self.play(Succession(*segment_animations), run_time = segment.run_time)
 
         for txt_update in txt_updates:
             txt_update.set_color(WHITE)
-        
-        if square_has_been_added:
-            self.play(Uncreate(square))
         return updates_from_allowed
 
 class UpdateFromExtrapolation(Scene):
-    def construct(self, val):
+    def construct(self, segment : Segment, sudoku : Sudoku):
+        """
+            Replays a segment made of COVER steps, each followed by the EXTRAPOLATION steps of its value, on sudoku
+            The phases of all its values are chained in a single self.play, so that a segment is a single partial movie file
+        """
+        size = sudoku.size
+        bloc_rows_cols = get_geometry(size).bloc_rows_cols
+        dgrid_squares = get_dgrid_squares(self, size)
         updates : list[tuple[int, int, int]] = []
-
-        dgrid : list[list[bool]] = [[SUDOKU.grid[row_id][col_id] == val for col_id in range(9)] for row_id in range(9)]
-        is_complete = True
-        for row in dgrid:
-            if True not in row:
-                is_complete = False
-        if is_complete:
-            return []
-
-        egrid : list[list[bool]] = SUDOKU.build_extrapolation_grid(val)
-        square_already_added_before : list[list[bool]] = [[False for __ in range(9)] for _ in range(9)]
-
-        noice_txt = Text(f"Zone couverte par les {val}").scale(0.35)
-        pos_noice_text = get_pos_in_dgrid_from_rowid_colid(-1, 4)
-        noice_txt.move_to(pos_noice_text)
-        self.add(noice_txt)
-
-        smol_detected_squares = []
-        for row_id in range(9):
-            for col_id in [c_id for c_id in range(9) if SUDOKU.grid[row_id][c_id] == val]:
-                if not square_already_added_before[row_id][col_id]:
-                    square_already_added_before[row_id][col_id] = True
-                    smol_square = Square(side_length=0.2).move_to(get_pos_in_dgrid_from_rowid_colid(row_id, col_id))
-                    smol_square.set_fill(WHITE, 1.0)
-                    smol_detected_squares.append(smol_square)
-        self.add(*[smol_square for smol_square in smol_detected_squares])
-        self.wait()
-
-        smol_row_squares = []
-        for row_id in range(9):
-            if True in dgrid[row_id]:
-                for col_id in range(9):
-                    if not square_already_added_before[row_id][col_id]:
-                        square_already_added_before[row_id][col_id] = True
-                        pos = get_pos_in_dgrid_from_rowid_colid(row_id, col_id)
-                        smol_row_square = Square(side_length = 0.2).move_to(pos).set_fill(WHITE, 1.0)
-                        smol_row_squares.append(smol_row_square)
-        self.add(*[smol_row_square for smol_row_square in smol_row_squares])
-        self.wait(DEFAULT_WAIT_TIME / 4)
-
-        smol_col_squares = []
-        for col_id in range(9):
-            if True in [dgrid[r_id][col_id] for r_id in range(9)]:
-                for row_id in range(9):
-                    if not square_already_added_before[row_id][col_id]:
-                        square_already_added_before[row_id][col_id] = True
-                        pos = get_pos_in_dgrid_from_rowid_colid(row_id, col_id)
-                        smol_col_square = Square(side_length = 0.2).move_to(pos).set_fill(WHITE, 1.0)
-                        smol_col_squares.append(smol_col_square)
-        self.add(*[smol_col_square for smol_col_square in smol_col_squares])
-        self.wait(DEFAULT_WAIT_TIME / 4)
-        
-        smol_bloc_squares = []
-        for bloc_id in range(9):
-            if True in [dgrid[r_id][c_id] for (r_id, c_id) in Sudoku.get_rows_cols_from_bloc_id(bloc_id)]:
-                for (row_id, col_id) in Sudoku.get_rows_cols_from_bloc_id(bloc_id):
+        # Animations of the phases, with the run times of the uncompressed video, self.play scales them to the segment
+        phases : list[Animation] = []
+        cover_ids = [step_id for step_id, step in enumerate(segment.steps) if step.technique == COVER] + [len(segment.steps)]
+
+        for start, end in zip(cover_ids[:-1], cover_ids[1:]):
+            cover_step, extrapolation_steps = segment.steps[start], segment.steps[start + 1:end]
+            val = cover_step.val
+            dgrid : list[list[bool]] = sudoku.build_detection_grid(val)
+            square_already_added_before : list[list[bool]] = [[False for __ in range(size)] for _ in range(size)]
+            # Squares shown by the phases of val, only those are animated
+            shown_cell_ids : list[int] = []
+
+            noice_txt = Text(f"Zone couverte par les {chr(VALUES_TO_DIGITS[val])}").scale(0.35)
+            noice_txt.move_to(get_pos_in_dgrid_from_rowid_colid(-1, size // 2, size))
+
+            def animate_squares(cell_ids: list[int], run_time: float, color = WHITE, opacity: float = 1.0) -> Animation:
+                return VGroup(*[dgrid_squares[cell_id] for cell_id in cell_ids]).animate(run_time = run_time).set_fill(color, opacity).set_stroke(opacity = opacity)
+
+            def show_new_squares(rows_cols: list[tuple[int, int]], run_time: float) -> Animation:
+                cell_ids : list[int] = []
+                for (row_id, col_id) in rows_cols:
                     if not square_already_added_before[row_id][col_id]:
                         square_already_added_before[row_id][col_id] = True
-                        pos = get_pos_in_dgrid_from_rowid_colid(row_id, col_id)
-                        smol_bloc_square = Square(side_length = 0.2).move_to(pos).set_fill(WHITE, 1.0)
-                        smol_bloc_squares.append(smol_bloc_square)
-        self.add(*[smol_bloc_square for smol_bloc_square in smol_bloc_squares])
-        self.wait(DEFAULT_WAIT_TIME / 4)
-
-        smol_remaining_squares = []
-        for (row_id, col_id) in sum([[(r_id, c_id) for c_id in range(9)] for r_id in range(9)], []):
-            if egrid[row_id][col_id] and not square_already_added_before[row_id][col_id]:
-                square_already_added_before[row_id][col_id] = True
-                pos = get_pos_in_dgrid_from_rowid_colid(row_id, col_id)
-                smol_remaining_square = Square(side_length = 0.2).move_to(pos).set_fill(WHITE, 1.0)
-                smol_remaining_squares.append(smol_remaining_square)
-        
-        self.add(*[smol_rem_square for smol_rem_square in smol_remaining_squares])
-        self.wait()
-
-        already_accounted_for : list[tuple[int, int]] = []
-        green_squares = []
-        new_txts_in_grid = []
-
-        # Row Check
-        for row_id in range(9):
-            row = egrid[row_id]
-            if len(row) == sum(row) + 1:
-                col_id = [c_id for c_id in range(9) if not egrid[row_id][c_id]][0]
-                if (row_id, col_id) not in already_accounted_for:
-                    already_accounted_for.append((row_id, col_id))
-                    updates.append((row_id, col_id, val))
-                    pos = get_pos_in_dgrid_from_rowid_colid(row_id, col_id)
-                    smol_green_square = Square(side_length=0.2).move_to(pos).set_fill(GREEN, 1.0)
-                    green_squares.append(smol_green_square)
-                    
-                    pos_in_grid = get_pos_in_grid_from_rowid_colid(row_id, col_id)
-                    new_txt_in_grid = Text(str(val), color = TEAL).scale(0.5).move_to(pos_in_grid)
-                    new_txts_in_grid.append(new_txt_in_grid)
-                    self.play(
-                        Create(smol_green_square),
-                        Write(new_txt_in_grid)
-                    )
-                    SUDOKU.grid[row_id][col_id] = val
-
-        # Row Check
-        for col_id in range(9):
-            col = [egrid[r_id][col_id] for r_id in range(9)]
-            if len(col) == sum(col) + 1:
-                row_id = [r_id for r_id in range(9) if not egrid[r_id][col_id]][0]
-                if (row_id, col_id) not in already_accounted_for:
-                    already_accounted_for.append((row_id, col_id))
-                    updates.append((row_id, col_id, val))
-                    pos = get_pos_in_dgrid_from_rowid_colid(row_id, col_id)
-                    smol_green_square = Square(side_length=0.2).move_to(pos).set_fill(GREEN, 1.0)
-                    green_squares.append(smol_green_square)
-                    
-                    pos_in_grid = get_pos_in_grid_from_rowid_colid(row_id, col_id)
-                    new_txt_in_grid = Text(str(val), color = TEAL).scale(0.5).move_to(pos_in_grid)
-                    new_txts_in_grid.append(new_txt_in_grid)
-                    self.play(
-                        Create(smol_green_square),
-                        Write(new_txt_in_grid)
-                    )
-                    SUDOKU.grid[row_id][col_id] = val
-
-        # Bloc Check
-        for bloc_id in range(9):
-            bloc = [egrid[r_id][c_id] for (r_id, c_id) in Sudoku.get_rows_cols_from_bloc_id(bloc_id)]
-            if len(bloc) == sum(bloc) + 1:
-                row_id, col_id = [(r_id, c_id) for (r_id, c_id) in Sudoku.get_rows_cols_from_bloc_id(bloc_id) if not egrid[r_id][c_id]][0]
-                if (row_id, col_id) not in already_accounted_for:
-                    already_accounted_for.append((row_id, col_id))
-                    updates.append((row_id, col_id, val))
-                    pos = get_pos_in_dgrid_from_rowid_colid(row_id, col_id)
-                    smol_green_square = Square(side_length=0.2).move_to(pos).set_fill(GREEN, 1.0)
-                    green_squares.append(smol_green_square)
-                    
-                    pos_in_grid = get_pos_in_grid_from_rowid_colid(row_id, col_id)
-                    new_txt_in_grid = Text(str(val), color = TEAL).scale(0.5).move_to(pos_in_grid)
-                    new_txts_in_grid.append(new_txt_in_grid)
-                    self.play(
-                        Create(smol_green_square),
-                        Write(new_txt_in_grid)
-                    )
-                    SUDOKU.grid[row_id][col_id] = val            
-
-        self.remove(*smol_detected_squares)
-        self.remove(*smol_row_squares)
-        self.remove(*smol_col_squares)
-        self.remove(*smol_bloc_squares)
-        self.remove(*smol_remaining_squares)
-        self.remove(*green_squares)
-        self.remove(noice_txt)
-        
-        for new_txt_in_grid in new_txts_in_grid:
-            new_txt_in_grid.set_color(WHITE)
-
-        self.wait()
-
+                        cell_ids.append(size * row_id + col_id)
+                if not cell_ids:
+                    return Wait(run_time)
+                shown_cell_ids.extend(cell_ids)
+                return animate_squares(cell_ids, run_time)
+
+            # Detected
+            phases.append(AnimationGroup(
+                FadeIn(noice_txt, run_time = DEFAULT_WAIT_TIME),
+                show_new_squares([(row_id, col_id) for row_id in range(size) for col_id in range(size) if dgrid[row_id][col_id]], DEFAULT_WAIT_TIME)
+            ))
+            # Rows
+            phases.append(show_new_squares([(row_id, col_id) for row_id in range(size) if True in dgrid[row_id] for col_id in range(size)], DEFAULT_WAIT_TIME / 4))
+            # Cols
+            phases.append(show_new_squares(
+                [(row_id, col_id) for col_id in range(size) if True in [dgrid[r_id][col_id] for r_id in range(size)] for row_id in range(size)], DEFAULT_WAIT_TIME / 4
+            ))
+            # Blocs
+            phases.append(show_new_squares([
+                (row_id, col_id) for bloc_id in range(size) if True in [dgrid[r_id][c_id] for (r_id, c_id) in bloc_rows_cols[bloc_id]]
+                for (row_id, col_id) in bloc_rows_cols[bloc_id]
+            ], DEFAULT_WAIT_TIME / 4))
+            # Remaining
+            phases.append(show_new_squares([divmod(cell_id, size) for cell_id in sorted(cover_step.covered)], DEFAULT_WAIT_TIME))
+
+            # Row, col and bloc checks, in the order of the trace
+            new_txts_in_grid : list[Text] = []
+            found_cell_ids : list[int] = []
+            for step in extrapolation_steps:
+                row_id, col_id = step.row_id, step.col_id
+                updates.append((row_id, col_id, val))
+                found_cell_ids.append(size * row_id + col_id)
+                new_txts_in_grid.append(get_digit_txt(val, row_id, col_id, TEAL, size))
+                sudoku.grid[row_id][col_id] = val
+            if new_txts_in_grid:
+                found_run_time = len(new_txts_in_grid) * WRITE_TIME
+                phases.append(AnimationGroup(
+                    animate_squares(found_cell_ids, found_run_time, GREEN),
+                    LaggedStart(*[Write(new_txt_in_grid) for new_txt_in_grid in new_txts_in_grid], run_time = found_run_time)
+                ))
+
+            hidden_cell_ids = shown_cell_ids + found_cell_ids
+            phases.append(AnimationGroup(
+                *([animate_squares(hidden_cell_ids, DEFAULT_WAIT_TIME, opacity = 0.0)] if hidden_cell_ids else []),
+                FadeOut(noice_txt, run_time = DEFAULT_WAIT_TIME),
+                *[new_txt_in_grid.animate(run_time = DEFAULT_WAIT_TIME).set_color(WHITE) for new_txt_in_grid in new_txts_in_grid]
+            ))
+
+        self.play(Succession(*phases), run_time = segment.run_time)
         return updates
 
 
 class UpdateFromExtrapolations(Scene):
-    def construct(self):
+    def construct(self, segments : list[Segment], sudoku : Sudoku):
+        """
+            Replays the segments of an extrapolation pass, one self.play per segment
+        """
         updates = []
-        for val in range(1, 10):
-            val_up = UpdateFromExtrapolation.construct(self, val)
+        for segment in segments:
+            val_up = UpdateFromExtrapolation.construct(self, segment, sudoku)
             updates.extend(val_up)
         return updates
 
 class UpdatesFromStuckPosition(Scene):
-    def construct(self):
+    def construct(self, segments : list[Segment], sudoku : Sudoku):
+        """
+            Replays the segments of a stuck position pass, the values found in a segment are written by a single self.play
+        """
         updates_from_stuck : list[tuple[int, int, int]] = []
-        for bloc_id in range(9):
-            rowcol_from_bloc = Sudoku.get_rows_cols_from_bloc_id(bloc_id)
-            available_rc_in_bloc = [(r, c) for  (r, c) in rowcol_from_bloc if SUDOKU.grid[r][c] == 0]
-
-            pos_where_val_is_allowed : dict[int, list[tuple[int, int]]] = {val : [] for val in range(1, 10)}
-            for row_id, col_id in available_rc_in_bloc:
-                allowed_vals = SUDOKU.get_allowed_values(row_id, col_id)
-                for allowed_val in allowed_vals:
-                    pos_where_val_is_allowed[allowed_val].append((row_id, col_id))
-            
-            # print(f"{bloc_id = }")
-            for val in range(1, 10):
-                if len(pos_where_val_is_allowed[val]) > 0:
-                    all_rows_where_val_could_be_in_bloc = list(set([row_id for (row_id, _) in pos_where_val_is_allowed[val]]))
-                    all_cols_where_val_could_be_in_bloc = list(set([col_id for (_, col_id) in pos_where_val_is_allowed[val]]))
-                    if len(all_rows_where_val_could_be_in_bloc) == 1:
-                        row_id = all_rows_where_val_could_be_in_bloc[0]
-                        empty_cells_in_row = [c_id for c_id in range(9) if SUDOKU.grid[row_id][c_id] == 0]
-                        remaining_empty_cells_row = [c_id for c_id in empty_cells_in_row if Sudoku.get_bloc_id(row_id, c_id) != bloc_id]
-                        allowed_vals : dict = {c_id : SUDOKU.get_allowed_values(row_id, c_id) for c_id in remaining_empty_cells_row}
-                        for c_id in allowed_vals.keys():
-                            allowed_vals[c_id] = [v for v in allowed_vals[c_id] if v != val]
-                        for c_id in allowed_vals.keys():
-                            if len(allowed_vals[c_id]) == 1:
-                                col_id = c_id
-                                only_allowed_val = allowed_vals[col_id][0]
-                                pos_in_grid = get_pos_in_grid_from_rowid_colid(row_id, col_id)
-                                self.play(Write(Text(str(only_allowed_val)).scale(0.5).move_to(pos_in_grid)))
-                                SUDOKU.grid[row_id][col_id] = only_allowed_val
-                                updates_from_stuck.append((row_id, col_id, only_allowed_val))
-
-                    elif len(all_cols_where_val_could_be_in_bloc) == 1:
-                        col_id = all_cols_where_val_could_be_in_bloc[0]
-                        empty_cells_in_col = [r_id for r_id in range(9) if SUDOKU.grid[r_id][col_id] == 0]
-                        remaining_empty_cells_col = [r_id for r_id in empty_cells_in_col if Sudoku.get_bloc_id(r_id, col_id) != bloc_id]
-                        allowed_vals_col = {r_id : SUDOKU.get_allowed_values(r_id, col_id) for r_id in remaining_empty_cells_col}
-                        for r_id in allowed_vals_col.keys():
-                            allowed_vals_col[r_id] = [v for v in allowed_vals_col[r_id] if v != val]
-                        for r_id in allowed_vals_col.keys():
-                            if len(allowed_vals_col[r_id]) == 1:
-                                row_id = r_id
-                                only_allowed_val = allowed_vals_col[row_id][0]
-                                pos_in_grid = get_pos_in_grid_from_rowid_colid(row_id, col_id)
-                                self.play(Write(Text(str(only_allowed_val)).scale(0.5).move_to(pos_in_grid)))
-                                SUDOKU.grid[row_id][col_id] = only_allowed_val
-                                updates_from_stuck.append((row_id, col_id, only_allowed_val))
-        return updates_from_stuck
+        eliminations : list[tuple[int, int, int]] = []
+        for segment in segments:
+            new_txts : list[Text] = []
+            for step in segment.steps:
+                if step.technique == ELIMINATION:
+                    sudoku.eliminate(step.row_id, step.col_id, step.val)
+                    eliminations.append((step.row_id, step.col_id, step.val))
+                    continue
+                new_txts.append(get_digit_txt(step.val, step.row_id, step.col_id, size = sudoku.size))
+                sudoku.grid[step.row_id][step.col_id] = step.val
+                updates_from_stuck.append((step.row_id, step.col_id, step.val))
+            if new_txts:
+                self.play(LaggedStart(*[Write(new_txt) for new_txt in new_txts]), run_time = segment.run_time)
+        return updates_from_stuck, eliminations
 
 class MainSudoku(Scene):
+    def __init__(self, *args, grid : list[list[int]] | None = None, trace : list[Step] | None = None,
+                 max_segments : int | None = MAX_SEGMENTS, target_duration : float | None = TARGET_DURATION, **kwargs):
+        """
+            Video of grid (GRID by default), replaying trace (recorded from grid if not given)
+            All the state of the video lives in the scene, so that several puzzles can be rendered in parallel
+        """
+        super().__init__(*args, **kwargs)
+        self.sudoku_grid : list[list[int]] = grid if grid is not None else GRID
+        self.trace : list[Step] = trace if trace is not None else (TRACE if grid is None else Sudoku(grid).record_trace())
+        self.max_segments = max_segments
+        self.target_duration = target_duration
+
     def construct(self):
-        print(SUDOKU)
-        BuildBackground.construct(self)
-        InitGrid.construct(self)
-        BuildDGridBackground.construct(self)
-
-        has_been_updated = True
-        while has_been_updated:
-            has_been_updated = False
-            has_been_updated = has_been_updated or len(UpdatesFromAllowed.construct(self)) > 0
-            has_been_updated = has_been_updated or len(UpdateFromExtrapolations.construct(self)) > 0
-            if not has_been_updated:
-                updates_from_stuck_position = UpdatesFromStuckPosition.construct(self)
+        sudoku = Sudoku(self.sudoku_grid)
+        print(sudoku)
+        BuildBackground.construct(self, sudoku.size)
+        InitGrid.construct(self, sudoku)
+        BuildDGridBackground.construct(self, sudoku.size)
+
+        render_plan : list[Segment] = build_render_plan(self.trace, self.max_segments, self.target_duration)
+        for _, segments in groupby(render_plan, key = lambda segment: segment.pass_id):
+            segments = list(segments)
+            technique_pass = segments[0].technique_pass
+            if technique_pass == ALLOWED:
+                UpdatesFromAllowed.construct(self, segments, sudoku)
+            elif technique_pass == EXTRAPOLATION:
+                UpdateFromExtrapolations.construct(self, segments, sudoku)
+            else:
+                updates_from_stuck_position, eliminations = UpdatesFromStuckPosition.construct(self, segments, sudoku)
                 print("***** START UPDATES FROM STUCK_POSITION *****")
+                for (row_id, col_id, val) in eliminations:
+                    print(f"S[{row_id}][{col_id}] != {val}")
                 for (row_id, col_id, val) in updates_from_stuck_position:
                     print(f"S[{row_id}][{col_id}] = {val}")
-                print("***** END OF UPDATES FROM STUCK_POSITION *****")     
-                has_been_updated = len(updates_from_stuck_position) > 0
-        print(SUDOKU)
+                print("***** END OF UPDATES FROM STUCK_POSITION *****")
+        print(sudoku)
 
-        for row_id in range(9):
-            for col_id in [c_id for c_id in range(9) if SUDOKU.grid[row_id][c_id] == 0]:
-                print(f"Allowed vals @[{row_id}][{col_id}] = {SUDOKU.get_allowed_values(row_id, col_id)}")
+        for row_id in range(sudoku.size):
+            for col_id in [c_id for c_id in range(sudoku.size) if sudoku.grid[row_id][c_id] == 0]:
+                print(f"Allowed vals @[{row_id}][{col_id}] = {sudoku.get_allowed_values(row_id, col_id)}")
             print()
+
+        if sudoku.get_empty_cell_count() > 0:
+            solved_sudoku = Sudoku(sudoku.grid)
+            nb_solutions = solved_sudoku.solve()
+            if nb_solutions == 0:
+                print("***** NO SOLUTION *****")
+            else:
+                print(f"***** {'UNIQUE' if nb_solutions == 1 else 'NON UNIQUE'} SOLUTION FROM SEARCH *****")
+                print(solved_sudoku)
+
+
+class SegmentScene(Scene):
+    """
+        Scene built by a callback, used to render the parts of a video as separate, cacheable files
+    """
+    def __init__(self, build: Callable[[Scene], None], **kwargs):
+        super().__init__(**kwargs)
+        self.build = build
+
+    def construct(self):
+        self.build(self)
+
+def render_cached(cache: RenderCache, key_parts: list, build: Callable[[Scene], None], pin_dir: str | None = None) -> str:
+    """
+        Path of the video of SegmentScene(build), rendered only if the cache has no segment for key_parts and the current style
+        With pin_dir, the path of its copy pinned in pin_dir (see RenderCache.get)
+    """
+    key = RenderCache.make_key(key_parts, get_style())
+    cached_path = cache.get(key, pin_dir = pin_dir)
+    if cached_path is not None:
+        return cached_path
+    with tempfile.TemporaryDirectory() as media_dir:
+        with tempconfig({"media_dir": media_dir, "output_file": key, "disable_caching": True}):
+            scene = SegmentScene(build)
+            scene.render()
+            return cache.put(key, str(scene.renderer.file_writer.movie_file_path), pin_dir)
+
+def concat_videos(video_paths: list[str], output_path: str):
+    with tempfile.NamedTemporaryFile("w", suffix = ".txt", delete = False) as list_file:
+        list_file.writelines(f"file '{os.path.abspath(video_path)}'\n" for video_path in video_paths)
+    try:
+        subprocess.run(["ffmpeg", "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", list_file.name, "-c", "copy", output_path], check = True)
+    finally:
+        os.remove(list_file.name)
+
+def render_sudoku_video(grid: list[list[int]], output_path: str, cache: RenderCache,
+                        max_segments: int | None = MAX_SEGMENTS, target_duration: float | None = None, trace: list[Step] | None = None) -> str:
+    """
+        Renders the MainSudoku video of grid part by part through the cache: the backgrounds are shared by all the grids,
+        the initial grid and each pass of the render plan are keyed by the grid state they start from and their steps
+        trace is recorded from grid if not given
+    """
+    sudoku = Sudoku(grid)
+    size = sudoku.size
+    if trace is None:
+        trace = Sudoku(grid).record_trace()
+    render_plan = build_render_plan(trace, max_segments, target_duration)
+
+    def build_background(scene: Scene):
+        BuildBackground.construct(scene, size)
+
+    def build_dgrid_background(scene: Scene):
+        scene.add(*build_background_lines(size))
+        BuildDGridBackground.construct(scene, size)
+
+    def build_init_grid(scene: Scene):
+        scene.add(*build_background_lines(size), *build_dgrid_background_lines(size))
+        InitGrid.construct(scene, Sudoku(grid))
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok = True)
+    # The parts are pinned next to the cache until they are concatenated, as other processes may evict them meanwhile
+    with tempfile.TemporaryDirectory(prefix = "pinned_", dir = cache.cache_dir) as pin_dir:
+        video_paths : list[str] = [
+            render_cached(cache, ["BuildBackground", size], build_background, pin_dir),
+            render_cached(cache, ["BuildDGridBackground", size], build_dgrid_background, pin_dir),
+            render_cached(cache, ["InitGrid", sudoku.to_string()], build_init_grid, pin_dir),
+        ]
+
+        for _, segments in groupby(render_plan, key = lambda segment: segment.pass_id):
+            segments = list(segments)
+            state_before = Sudoku(sudoku.grid)
+            state_before.eliminated_masks.update(sudoku.eliminated_masks)
+
+            def build_pass(scene: Scene, segments : list[Segment] = segments, state_before : Sudoku = state_before):
+                scene.add(*build_background_lines(size), *build_dgrid_background_lines(size))
+                add_grid_digits(scene, state_before)
+                get_dgrid_squares(scene, size)
+                if segments[0].technique_pass == ALLOWED:
+                    UpdatesFromAllowed.construct(scene, segments, state_before)
+                elif segments[0].technique_pass == EXTRAPOLATION:
+                    UpdateFromExtrapolations.construct(scene, segments, state_before)
+                else:
+                    UpdatesFromStuckPosition.construct(scene, segments, state_before)
+
+            # A stuck position pass can only rule out values: its scene would have no self.play, hence no movie file
+            if any(step.technique != ELIMINATION for segment in segments for step in segment.steps):
+                key_parts = ["Pass", state_before.to_string(), sorted(state_before.eliminated_masks.items()), segments]
+                video_paths.append(render_cached(cache, key_parts, build_pass, pin_dir))
+            sudoku.replay([step for segment in segments for step in segment.steps])
+
+        concat_videos(video_paths, output_path)
+    return output_path
+
+if __name__ == "__main__":
+    render_sudoku_video(GRID, os.path.join("media", "MainSudoku.mp4"), RenderCache(os.path.join("media", "render_cache")))
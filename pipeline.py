@@ -0,0 +1,83 @@
+"""
+    Renders the videos of a file of puzzles, one worker process per puzzle
+"""
+import os
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from os import cpu_count
+from time import perf_counter
+from typing import Iterator, NamedTuple
+from batch import read_puzzles
+from sudoku import Sudoku
+
+class RenderJob(NamedTuple):
+    puzzle_id : int
+    puzzle : str
+    output_dir : str
+    cache_dir : str | None = None      # Shared RenderCache directory, None to render MainSudoku in one go
+    max_segments : int | None = None
+    target_duration : float | None = None
+
+class RenderResult(NamedTuple):
+    puzzle_id : int
+    video_path : str
+    solve_time : float
+    render_time : float
+
+def render_puzzle(job: RenderJob) -> RenderResult:
+    """
+        Solves the puzzle headlessly, then renders its video in a media dir of its own
+    """
+    # manim is only imported in the workers, the parent process never renders
+    from manim import tempconfig
+    from main import MainSudoku, render_sudoku_video
+    from render_cache import RenderCache
+
+    start = perf_counter()
+    sudoku = Sudoku.from_string(job.puzzle)
+    grid = [list(row) for row in sudoku.grid]
+    trace = sudoku.record_trace()
+    solve_time = perf_counter() - start
+
+    name = f"puzzle_{job.puzzle_id:05d}"
+    media_dir = os.path.join(job.output_dir, name)
+    start = perf_counter()
+    if job.cache_dir is not None:
+        video_path = render_sudoku_video(grid, os.path.join(job.output_dir, name + ".mp4"), RenderCache(job.cache_dir), job.max_segments, job.target_duration, trace)
+    else:
+        with tempconfig({"media_dir": media_dir, "output_file": name}):
+            scene = MainSudoku(grid = grid, trace = trace, max_segments = job.max_segments, target_duration = job.target_duration)
+            scene.render()
+            video_path = str(scene.renderer.file_writer.movie_file_path)
+    return RenderResult(job.puzzle_id, video_path, solve_time, perf_counter() - start)
+
+def render_many(jobs: list[RenderJob], workers: int | None = None) -> Iterator[RenderResult]:
+    """
+        Yields the results as the videos are done. Each worker process renders a single puzzle then exits,
+        so that no module state (SUDOKU, manim config...) leaks from one video to the next.
+    """
+    with ProcessPoolExecutor(max_workers = workers or cpu_count() or 1, max_tasks_per_child = 1) as executor:
+        futures = [executor.submit(render_puzzle, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Render the video of each puzzle of a file (one 81 char puzzle per line)")
+    parser.add_argument("puzzles")
+    parser.add_argument("-o", "--output-dir", default=os.path.join("media", "puzzles"))
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument("--cache-dir", default=None, help="Render through a RenderCache shared by the workers")
+    parser.add_argument("--max-segments", type=int, default=200)
+    parser.add_argument("--target-duration", type=float, default=None)
+    args = parser.parse_args()
+
+    jobs = [
+        RenderJob(puzzle_id, puzzle, args.output_dir, args.cache_dir, args.max_segments, args.target_duration)
+        for puzzle_id, puzzle in enumerate(read_puzzles(args.puzzles))
+    ]
+    start = perf_counter()
+    for nb_done, result in enumerate(render_many(jobs, args.workers), start=1):
+        print(f"[{nb_done}/{len(jobs)}] puzzle {result.puzzle_id}: solved in {result.solve_time * 1000:.1f}ms, "
+              f"rendered in {result.render_time:.1f}s -> {result.video_path}", file=sys.stderr)
+    print(f"{len(jobs)} videos in {perf_counter() - start:.1f}s", file=sys.stderr)
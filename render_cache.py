@@ -0,0 +1,87 @@
+"""
+    Content addressed on-disk cache of rendered video segments, with size bounded LRU eviction
+"""
+import hashlib
+import json
+import os
+import shutil
+
+class RenderCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 2 * 1024 ** 3):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(*key_parts) -> str:
+        """
+            Hash of the JSON form of key_parts (grid state, steps, style...)
+        """
+        key_json = json.dumps(key_parts, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(key_json.encode("utf-8")).hexdigest()
+
+    def get_path(self, key: str, extension: str = ".mp4") -> str:
+        return os.path.join(self.cache_dir, key + extension)
+
+    def get(self, key: str, extension: str = ".mp4", pin_dir: str | None = None) -> str | None:
+        """
+            Path of the cached segment, None on a miss. A hit marks the segment as recently used.
+            With pin_dir, the segment is hard linked (or copied) into it and the returned path is the pinned one,
+            which stays valid when another process evicts the segment.
+        """
+        path = self.get_path(key, extension)
+        try:
+            os.utime(path)
+            return path if pin_dir is None else self.pin(path, pin_dir, os.path.basename(path))
+        except FileNotFoundError:
+            # Missing, or evicted by another process sharing the cache since
+            return None
+
+    @staticmethod
+    def pin(path: str, pin_dir: str, name: str) -> str:
+        pinned_path = os.path.join(pin_dir, name)
+        try:
+            os.link(path, pinned_path)
+        except FileExistsError:
+            pass
+        except FileNotFoundError:
+            raise
+        except OSError:
+            # pin_dir on another file system, or no hard links
+            shutil.copyfile(path, pinned_path)
+        return pinned_path
+
+    def put(self, key: str, video_path: str, pin_dir: str | None = None) -> str:
+        """
+            Copies the rendered segment into the cache, evicts the least recently used ones if needed, returns its cached path
+            (its pinned path with pin_dir, see get)
+        """
+        path = self.get_path(key, os.path.splitext(video_path)[1])
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        shutil.copyfile(video_path, tmp_path)
+        pinned_path = None if pin_dir is None else self.pin(tmp_path, pin_dir, os.path.basename(path))
+        os.replace(tmp_path, path)
+        self.evict(keep = path)
+        return path if pinned_path is None else pinned_path
+
+    def evict(self, keep: str | None = None):
+        entries : list[tuple[float, int, str]] = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total_bytes = sum(size for (_, size, _) in entries)
+        for (_, size, path) in sorted(entries):
+            if total_bytes <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Already evicted by another process sharing the cache
+                pass
+            total_bytes -= size
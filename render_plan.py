@@ -0,0 +1,104 @@
+"""
+    Render plan: groups the steps of a trace into the segments the scenes play, under a segment count or duration budget
+"""
+from itertools import groupby
+from math import ceil
+from typing import NamedTuple
+from sudoku import Step, ALLOWED, COVER, EXTRAPOLATION, ELIMINATION, STUCK_POSITION
+
+# Pass of the trace each technique belongs to
+PASS_OF_TECHNIQUE : dict[str, str] = {
+    ALLOWED: ALLOWED,
+    COVER: EXTRAPOLATION,
+    EXTRAPOLATION: EXTRAPOLATION,
+    ELIMINATION: STUCK_POSITION,
+    STUCK_POSITION: STUCK_POSITION,
+}
+
+# Duration of the steps in the uncompressed video, in seconds
+VISIT_TIME : float = 0.25
+WRITE_TIME : float = 1.0
+COVER_TIME : float = 3.75   # Waits of the cover phases (1 + 3 * 0.25 + 1) and final wait (1)
+MIN_RUN_TIME : float = 1 / 15
+
+class Segment(NamedTuple):
+    pass_id : int               # Consecutive segments of the same pass share it
+    technique_pass : str        # ALLOWED, EXTRAPOLATION or STUCK_POSITION
+    steps : tuple[Step, ...]
+    run_time : float
+
+def get_step_run_time(step: Step) -> float:
+    if step.technique == ALLOWED:
+        return VISIT_TIME + (WRITE_TIME if step.val > 0 else 0.0)
+    if step.technique == COVER:
+        return COVER_TIME
+    if step.technique in (EXTRAPOLATION, STUCK_POSITION):
+        return WRITE_TIME
+    return 0.0
+
+def get_default_run_time(steps: tuple[Step, ...] | list[Step]) -> float:
+    return sum(get_step_run_time(step) for step in steps)
+
+def get_nb_animated_units(technique_pass: str, steps: list[Step]) -> int:
+    """
+        Units merged by the budget: the values of an extrapolation pass (a COVER step and its EXTRAPOLATION steps),
+        the animated steps of the other passes
+    """
+    if technique_pass == EXTRAPOLATION:
+        return sum(1 for step in steps if step.technique == COVER)
+    return sum(1 for step in steps if step.technique != ELIMINATION)
+
+def split_pass(technique_pass: str, steps: list[Step], batch_size: int) -> list[list[Step]]:
+    """
+        Splits a pass in batches of batch_size animated units (see get_nb_animated_units).
+        The eliminations of a stuck position pass are not animated, they go with its first batch.
+    """
+    if technique_pass == EXTRAPOLATION:
+        cover_ids = [step_id for step_id, step in enumerate(steps) if step.technique == COVER]
+        bounds = cover_ids[::batch_size] + [len(steps)]
+        return [steps[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
+    eliminations = [step for step in steps if step.technique == ELIMINATION]
+    animated_steps = [step for step in steps if step.technique != ELIMINATION]
+    batches = [animated_steps[start:start + batch_size] for start in range(0, len(animated_steps), batch_size)] or [[]]
+    batches[0] = eliminations + batches[0]
+    return batches
+
+def get_batch_size(nb_units_per_pass: list[int], max_segments: int) -> int:
+    """
+        Smallest batch size giving at most max_segments segments. Each pass keeps at least one segment of its own,
+        so with more passes than max_segments there is one segment per pass.
+    """
+    low, high = 1, max(nb_units_per_pass + [1])
+    while low < high:
+        batch_size = (low + high) // 2
+        if sum(max(1, ceil(nb_units / batch_size)) for nb_units in nb_units_per_pass) <= max_segments:
+            high = batch_size
+        else:
+            low = batch_size + 1
+    return low
+
+def build_render_plan(trace: list[Step], max_segments: int | None = None, target_duration: float | None = None) -> list[Segment]:
+    """
+        Without budget, each animated step (each value for the extrapolation passes) gets its own segment (one self.play).
+        max_segments: consecutive units of a pass are merged so that there are at most max_segments segments,
+            or one per pass when there are more passes than that
+        target_duration: run times are scaled down so that the video lasts about target_duration seconds
+    """
+    passes : list[tuple[str, list[Step]]] = [
+        (technique_pass, list(steps)) for technique_pass, steps in groupby(trace, key = lambda step: PASS_OF_TECHNIQUE[step.technique])
+    ]
+
+    batch_size = 1
+    if max_segments is not None:
+        batch_size = get_batch_size([get_nb_animated_units(technique_pass, steps) for technique_pass, steps in passes], max_segments)
+
+    segments : list[Segment] = []
+    for pass_id, (technique_pass, steps) in enumerate(passes):
+        for batch in split_pass(technique_pass, steps, batch_size):
+            segments.append(Segment(pass_id, technique_pass, tuple(batch), get_default_run_time(batch)))
+
+    total_run_time = sum(segment.run_time for segment in segments)
+    if target_duration is not None and total_run_time > target_duration:
+        scale = target_duration / total_run_time
+        segments = [segment._replace(run_time = segment.run_time * scale) for segment in segments]
+    return [segment._replace(run_time = max(segment.run_time, MIN_RUN_TIME)) for segment in segments]
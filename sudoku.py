@@ -1,111 +1,471 @@
 """
     Sudoku class
 """
-from copy import deepcopy
-from time import sleep
+import json
+from collections import deque
+from math import isqrt
+from time import perf_counter, sleep
+from typing import Callable, Iterator, NamedTuple
+
+class ValuesFromMask:
+    """
+        values_from_mask[mask] lists the values whose bit (val - 1) is NOT set in mask, computed from the bits
+        for the boards whose masks are too wide for a table
+    """
+    __slots__ = ("all_values_mask",)
+
+    def __init__(self, size: int):
+        self.all_values_mask : int = (1 << size) - 1
+
+    def __getitem__(self, mask: int) -> list[int]:
+        vals : list[int] = []
+        free_mask = self.all_values_mask & ~mask
+        while free_mask:
+            bit = free_mask & -free_mask
+            vals.append(bit.bit_length())
+            free_mask ^= bit
+        return vals
+
+class Geometry:
+    """
+        Tables of a size x size board made of box_size x box_size blocs (size = box_size ** 2, e.g. 4, 9, 16, 25),
+        built once per size by get_geometry. Cells are indexed by cell_id = size * row_id + col_id.
+    """
+    def __init__(self, box_size: int):
+        size = box_size * box_size
+        self.box_size : int = box_size
+        self.size : int = size
+        self.nb_cells : int = size * size
+        self.all_values_mask : int = (1 << size) - 1
+        # allowed_values_from_mask[mask] lists the values whose bit (val - 1) is NOT set in mask
+        self.allowed_values_from_mask : list[list[int]] | ValuesFromMask = (
+            [[val for val in range(1, size + 1) if not (mask >> (val - 1)) & 1] for mask in range(1 << size)] if size <= 9 else ValuesFromMask(size)
+        )
+
+        self.rows : tuple[tuple[int, ...], ...] = tuple(tuple(size * row_id + col_id for col_id in range(size)) for row_id in range(size))
+        self.cols : tuple[tuple[int, ...], ...] = tuple(tuple(size * row_id + col_id for row_id in range(size)) for col_id in range(size))
+        self.blocs : tuple[tuple[int, ...], ...] = tuple(
+            tuple(
+                size * row_id + col_id
+                for row_id in range(box_size * (bloc_id // box_size), box_size * (bloc_id // box_size) + box_size)
+                for col_id in range(box_size * (bloc_id % box_size), box_size * (bloc_id % box_size) + box_size)
+            )
+            for bloc_id in range(size)
+        )
+        self.units : tuple[tuple[int, ...], ...] = self.rows + self.cols + self.blocs
+        self.bloc_of_cell : tuple[int, ...] = tuple(
+            box_size * (cell_id // (size * box_size)) + (cell_id % size) // box_size for cell_id in range(self.nb_cells)
+        )
+        self.bloc_rows_cols : tuple[tuple[tuple[int, int], ...], ...] = tuple(tuple(divmod(cell_id, size) for cell_id in bloc) for bloc in self.blocs)
+        # units ids of the row, the col and the bloc of each cell
+        self.units_of_cell : tuple[tuple[int, int, int], ...] = tuple(
+            (cell_id // size, size + cell_id % size, 2 * size + self.bloc_of_cell[cell_id]) for cell_id in range(self.nb_cells)
+        )
+        # A segment is the intersection of a row or a col (a line) with a bloc, the size * box_size first ones are in rows
+        self.segments : tuple[tuple[int, ...], ...] = tuple(
+            tuple(cell_id for cell_id in line if self.bloc_of_cell[cell_id] == bloc_id)
+            for line in self.rows + self.cols for bloc_id in sorted(set(self.bloc_of_cell[cell_id] for cell_id in line))
+        )
+        # For each segment, the cells of its line outside of its bloc, and the cells of its bloc outside of its line
+        self.segment_line_rests : tuple[tuple[int, ...], ...] = tuple(
+            tuple(cell_id for cell_id in self.units[seg_id // box_size] if cell_id not in segment) for seg_id, segment in enumerate(self.segments)
+        )
+        self.segment_bloc_rests : tuple[tuple[int, ...], ...] = tuple(
+            tuple(cell_id for cell_id in self.blocs[self.bloc_of_cell[segment[0]]] if cell_id not in segment) for segment in self.segments
+        )
+        # The row segments and the col segments of each bloc
+        nb_row_segments = size * box_size
+        self.bloc_segments : tuple[tuple[tuple[int, ...], tuple[int, ...]], ...] = tuple(
+            (
+                tuple(seg_id for seg_id in range(nb_row_segments) if self.bloc_of_cell[self.segments[seg_id][0]] == bloc_id),
+                tuple(seg_id for seg_id in range(nb_row_segments, 2 * nb_row_segments) if self.bloc_of_cell[self.segments[seg_id][0]] == bloc_id),
+            )
+            for bloc_id in range(size)
+        )
+        self.peers : tuple[tuple[int, ...], ...] = tuple(
+            tuple(sorted((set(self.rows[cell_id // size]) | set(self.cols[cell_id % size]) | set(self.blocs[self.bloc_of_cell[cell_id]])) - {cell_id}))
+            for cell_id in range(self.nb_cells)
+        )
+
+        # __str__ layout: the cells of a region are written every other char of a "| a b c | d e f | g h i | " line
+        region_width = 2 * box_size - 1
+        line = b"| " + b" | ".join([b" " * region_width] * box_size) + b" | \n"
+        self.grid_separator_line : bytes = b"-" * (len(line) - 2) + b"\n"
+        self.grid_template : bytes = self.grid_separator_line + box_size * (box_size * line + self.grid_separator_line)
+        # (offset of the first char in grid_template, first cell_id) of each row region
+        self.grid_region_offsets : tuple[tuple[int, int], ...] = tuple(
+            (len(self.grid_separator_line) * (1 + row_id // box_size) + len(line) * row_id + 2 + (region_width + 3) * region_id, size * row_id + box_size * region_id)
+            for row_id in range(size) for region_id in range(box_size)
+        )
+
+GEOMETRIES : dict[int, Geometry] = {}
+
+def get_geometry(size: int) -> Geometry:
+    """
+        Tables of the size x size boards, size must be a square (4, 9, 16, 25)
+    """
+    if size not in GEOMETRIES:
+        box_size = isqrt(size)
+        assert box_size > 1 and box_size * box_size == size, f"Expected a square board size (4, 9, 16, 25...), got {size}"
+        assert size <= 35, f"Values are written with a single char (1-9 then A-Z), got a size of {size}"
+        GEOMETRIES[size] = Geometry(box_size)
+    return GEOMETRIES[size]
+
+# Tables of the classic 9 x 9 board
+GEOMETRY : Geometry = get_geometry(9)
+ALL_VALUES_MASK : int = GEOMETRY.all_values_mask
+ALLOWED_VALUES_FROM_MASK : list[list[int]] = GEOMETRY.allowed_values_from_mask
+ROWS : tuple[tuple[int, ...], ...] = GEOMETRY.rows
+COLS : tuple[tuple[int, ...], ...] = GEOMETRY.cols
+BLOCS : tuple[tuple[int, ...], ...] = GEOMETRY.blocs
+UNITS : tuple[tuple[int, ...], ...] = GEOMETRY.units
+BLOC_OF_CELL : tuple[int, ...] = GEOMETRY.bloc_of_cell
+BLOC_ROWS_COLS : tuple[tuple[tuple[int, int], ...], ...] = GEOMETRY.bloc_rows_cols
+UNITS_OF_CELL : tuple[tuple[int, int, int], ...] = GEOMETRY.units_of_cell
+SEGMENTS : tuple[tuple[int, ...], ...] = GEOMETRY.segments
+SEGMENT_LINE_RESTS : tuple[tuple[int, ...], ...] = GEOMETRY.segment_line_rests
+SEGMENT_BLOC_RESTS : tuple[tuple[int, ...], ...] = GEOMETRY.segment_bloc_rests
+BLOC_SEGMENTS : tuple[tuple[tuple[int, ...], tuple[int, ...]], ...] = GEOMETRY.bloc_segments
+PEERS : tuple[tuple[int, ...], ...] = GEOMETRY.peers
+
+# bytes.translate tables between the chars of a puzzle string and the cell values: '1'-'9' then 'A'-'Z' (or 'a'-'z')
+# for 10-35 on the bigger boards, any other char is an empty cell
+DIGITS_TO_VALUES : bytes = bytes(
+    ch - ord("0") if ord("1") <= ch <= ord("9") else
+    ch - ord("A") + 10 if ord("A") <= ch <= ord("Z") else
+    ch - ord("a") + 10 if ord("a") <= ch <= ord("z") else 0
+    for ch in range(256)
+)
+VALUES_TO_DIGITS : bytes = bytes(ord("0") + val if val < 10 else ord("A") + val - 10 if val < 36 else ord("?") for val in range(256))
+# Same with a space for the empty cells, for __str__
+VALUES_TO_DISPLAY : bytes = b" " + VALUES_TO_DIGITS[1:]
+
+# Techniques of the trace steps
+ALLOWED : str = "allowed"                # Empty cell visited by the allowed values pass, val > 0 if it was the only allowed value
+COVER : str = "cover"                    # Cells covered by val in the extrapolation grid, before its updates
+EXTRAPOLATION : str = "extrapolation"    # val found as the only uncovered cell of unit
+ELIMINATION : str = "elimination"        # val ruled out of the cell by the stuck position pass
+STUCK_POSITION : str = "stuck_position"  # val found as the only value left by the stuck position eliminations
+
+class Step(NamedTuple):
+    technique : str
+    row_id : int = -1
+    col_id : int = -1
+    val : int = 0
+    unit_id : int = -1                  # UNITS id supporting the step, -1 if none
+    covered : tuple[int, ...] = ()      # cell ids
+
+def trace_to_json(trace: list[Step]) -> str:
+    return json.dumps([list(step) for step in trace], separators=(",", ":"))
+
+def trace_from_json(trace_json: str) -> list[Step]:
+    return [Step(technique, row_id, col_id, val, unit_id, tuple(covered)) for (technique, row_id, col_id, val, unit_id, covered) in json.loads(trace_json)]
+
+# Extra keys of SolverStats, for the routines that are not a single technique of the trace
+CACHE_HIT : str = "cache_hit"            # Results copied by a CanonicalCache instead of being computed
+SEARCH : str = "search"                  # Exhaustive search of solve
+
+class TechniqueStats:
+    __slots__ = ("calls", "cells_resolved", "eliminations", "seconds")
+
+    def __init__(self, calls: int = 0, cells_resolved: int = 0, eliminations: int = 0, seconds: float = 0.0):
+        self.calls : int = calls
+        self.cells_resolved : int = cells_resolved
+        self.eliminations : int = eliminations
+        self.seconds : float = seconds
+
+    def to_dict(self) -> dict[str, int | float]:
+        return {"calls": self.calls, "cells_resolved": self.cells_resolved, "eliminations": self.eliminations, "seconds": self.seconds}
+
+class SolverStats:
+    """
+        Per technique counters of a Sudoku, enabled with sudoku.stats = SolverStats() (stats is None by default,
+        the solver then only checks it once per pass). The same SolverStats can be shared by many Sudokus and
+        merged across processes to see where the time goes on a whole corpus.
+        hooks are called as hook(technique, cells_resolved, eliminations, seconds) on each record.
+    """
+    __slots__ = ("techniques", "hooks")
+
+    def __init__(self, hooks: list[Callable[[str, int, int, float], None]] | None = None):
+        self.techniques : dict[str, TechniqueStats] = {}
+        self.hooks : list[Callable[[str, int, int, float], None]] = hooks if hooks is not None else []
+
+    def __getstate__(self):
+        # Hooks are often lambdas or bound to local state, they are not sent to other processes
+        return (None, {"techniques": self.techniques, "hooks": []})
+
+    def record(self, technique: str, cells_resolved: int, seconds: float, eliminations: int = 0):
+        technique_stats = self.techniques.get(technique)
+        if technique_stats is None:
+            technique_stats = self.techniques[technique] = TechniqueStats()
+        technique_stats.calls += 1
+        technique_stats.cells_resolved += cells_resolved
+        technique_stats.eliminations += eliminations
+        technique_stats.seconds += seconds
+        for hook in self.hooks:
+            hook(technique, cells_resolved, eliminations, seconds)
+
+    def merge(self, other: "SolverStats"):
+        for technique, other_stats in other.techniques.items():
+            technique_stats = self.techniques.get(technique)
+            if technique_stats is None:
+                technique_stats = self.techniques[technique] = TechniqueStats()
+            technique_stats.calls += other_stats.calls
+            technique_stats.cells_resolved += other_stats.cells_resolved
+            technique_stats.eliminations += other_stats.eliminations
+            technique_stats.seconds += other_stats.seconds
+
+    def to_dict(self) -> dict[str, dict[str, int | float]]:
+        return {technique: technique_stats.to_dict() for technique, technique_stats in self.techniques.items()}
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+    @classmethod
+    def from_dict(cls, stats_dict: dict[str, dict[str, int | float]]) -> "SolverStats":
+        stats = cls()
+        stats.techniques = {technique: TechniqueStats(**technique_stats) for technique, technique_stats in stats_dict.items()}
+        return stats
+
+    def __str__(self):
+        total_seconds = sum(technique_stats.seconds for technique_stats in self.techniques.values()) or 1.0
+        lines = [f"{'technique':<16}{'calls':>10}{'resolved':>10}{'eliminated':>12}{'seconds':>10}{'time %':>8}"]
+        for technique, technique_stats in self.techniques.items():
+            lines.append(f"{technique:<16}{technique_stats.calls:>10}{technique_stats.cells_resolved:>10}{technique_stats.eliminations:>12}"
+                         f"{technique_stats.seconds:>10.3f}{100 * technique_stats.seconds / total_seconds:>8.1f}")
+        return "\n".join(lines)
+
+class SudokuRow:
+    """
+        View on one row of a Sudoku, assignments go through Sudoku.set_value
+    """
+    __slots__ = ("sudoku", "row_id")
+
+    def __init__(self, sudoku: "Sudoku", row_id: int):
+        self.sudoku = sudoku
+        self.row_id = row_id
+
+    def __getitem__(self, col_id: int | slice) -> int | list[int]:
+        size = self.sudoku.size
+        if isinstance(col_id, slice):
+            return list(self.sudoku.cells[size * self.row_id:size * (self.row_id + 1)][col_id])
+        return self.sudoku.cells[size * self.row_id + range(size)[col_id]]
+
+    def __setitem__(self, col_id: int, val: int):
+        self.sudoku.set_value(self.row_id, range(self.sudoku.size)[col_id], val)
+
+    def __len__(self) -> int:
+        return self.sudoku.size
+
+    def __iter__(self):
+        return iter(self.sudoku.cells[self.sudoku.size * self.row_id:self.sudoku.size * (self.row_id + 1)])
+
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return repr(list(self))
+
+class SudokuGrid:
+    """
+        list[list[int]] compatible view on the cells of a Sudoku
+    """
+    __slots__ = ("sudoku",)
+
+    def __init__(self, sudoku: "Sudoku"):
+        self.sudoku = sudoku
+
+    def __getitem__(self, row_id: int | slice) -> SudokuRow | list[SudokuRow]:
+        if isinstance(row_id, slice):
+            return [SudokuRow(self.sudoku, r_id) for r_id in range(self.sudoku.size)[row_id]]
+        return SudokuRow(self.sudoku, range(self.sudoku.size)[row_id])
+
+    def __len__(self) -> int:
+        return self.sudoku.size
+
+    def __iter__(self):
+        return (SudokuRow(self.sudoku, row_id) for row_id in range(self.sudoku.size))
+
+    def __eq__(self, other) -> bool:
+        return [list(row) for row in self] == [list(row) for row in other]
+
+    def __repr__(self) -> str:
+        return repr([list(row) for row in self])
 
 class Sudoku:
-    def __init__(self, grid : list[list[int]]):
-        self.grid : list[list[int]] = deepcopy(grid)
-    
+    """
+        The size * size cells (81 on the classic board, the size is deduced from their number) are stored row by row
+        in a bytearray (or any writable byte buffer), grid is a list-like view on them
+    """
+    __slots__ = ("cells", "size", "geometry", "row_masks", "col_masks", "bloc_masks", "nb_empty_cells", "eliminated_masks", "stats")
+
+    def __init__(self, grid : list[list[int]] | None = None, cells : bytearray | memoryview | None = None):
+        self.cells : bytearray | memoryview = cells if cells is not None else bytearray(val for row in grid for val in row)
+        self.size : int = isqrt(len(self.cells))
+        assert self.size * self.size == len(self.cells), f"Expected size * size cells (16, 81, 256, 625...), got {len(self.cells)}"
+        self.geometry : Geometry = get_geometry(self.size)
+        # Bit (val - 1) is set when val is already placed in the row / col / bloc
+        self.row_masks : list[int] = [0] * self.size
+        self.col_masks : list[int] = [0] * self.size
+        self.bloc_masks : list[int] = [0] * self.size
+        self.nb_empty_cells : int = 0
+        # cell_id -> bits of the values ruled out in the cell by the stuck position pass, on top of the masks
+        self.eliminated_masks : dict[int, int] = {}
+        # Per technique counters, None when disabled
+        self.stats : SolverStats | None = None
+        for cell_id, val in enumerate(self.cells):
+            if val > 0:
+                self._add_to_masks(cell_id // self.size, cell_id % self.size, val)
+            else:
+                self.nb_empty_cells += 1
+
+    @classmethod
+    def from_string(cls, puzzle: str) -> "Sudoku":
+        """
+            Builds a Sudoku from a size * size char string read row by row (81 chars on the classic board),
+            '0' or '.' for empty cells, 'A'-'Z' for the values from 10 on the bigger boards
+        """
+        return cls(cells=bytearray(puzzle.strip().encode("ascii").translate(DIGITS_TO_VALUES)))
+
+    @classmethod
+    def from_buffer(cls, buffer: bytearray | memoryview) -> "Sudoku":
+        """
+            Builds a Sudoku on top of a writable buffer of size * size cell values (0 for empty cells) without copying it,
+            e.g. a memoryview slice of one big bytearray holding many grids. The buffer is updated in place.
+        """
+        return cls(cells=memoryview(buffer).cast("B"))
+
+    def to_string(self) -> str:
+        return bytes(self.cells).translate(VALUES_TO_DIGITS).decode("ascii")
+
+    def __reduce__(self):
+        return (Sudoku.from_buffer, (bytearray(self.cells),), (None, {"eliminated_masks": dict(self.eliminated_masks), "stats": self.stats}))
+
+    @property
+    def grid(self) -> SudokuGrid:
+        return SudokuGrid(self)
+
+    def _add_to_masks(self, row_id: int, col_id: int, val: int):
+        bit = 1 << (val - 1)
+        self.row_masks[row_id] |= bit
+        self.col_masks[col_id] |= bit
+        self.bloc_masks[self.geometry.bloc_of_cell[self.size * row_id + col_id]] |= bit
+
+    def _remove_from_masks(self, row_id: int, col_id: int, val: int):
+        bit = ~(1 << (val - 1))
+        self.row_masks[row_id] &= bit
+        self.col_masks[col_id] &= bit
+        self.bloc_masks[self.geometry.bloc_of_cell[self.size * row_id + col_id]] &= bit
+
+    def set_value(self, row_id: int, col_id: int, val: int):
+        """
+            Sets grid[row_id][col_id] to val (0 empties the cell) and updates the masks in O(1)
+        """
+        cell_id = self.size * row_id + col_id
+        old_val = self.cells[cell_id]
+        if old_val == val:
+            return
+        if old_val > 0:
+            self._remove_from_masks(row_id, col_id, old_val)
+        else:
+            self.nb_empty_cells -= 1
+        if val > 0:
+            self._add_to_masks(row_id, col_id, val)
+            self.eliminated_masks.pop(cell_id, None)
+        else:
+            self.nb_empty_cells += 1
+            # Eliminations only hold while values are added to the grid
+            self.eliminated_masks.clear()
+        self.cells[cell_id] = val
+
     def __str__(self):
-        output : str = "-" * 25 + "\n"
-        for line_id, line in enumerate(self.grid):
-            output = output + "| "
-            for region_id in range(3):
-                region = [str(i) if i > 0 else " " for i in line[3*region_id:3*(region_id + 1)]]
-                output = output + " ".join(region) + " | "
-            output = output + "\n" 
-            if line_id % 3 == 2:
-                output = output + 25 * "-" + "\n"
-        return output
+        display = bytes(self.cells).translate(VALUES_TO_DISPLAY)
+        buffer = bytearray(self.geometry.grid_template)
+        box_size = self.geometry.box_size
+        for offset, cell_id in self.geometry.grid_region_offsets:
+            buffer[offset:offset + 2 * box_size - 1:2] = display[cell_id:cell_id + box_size]
+        return buffer.decode("ascii")
 
     def get_vals_in_bloc(self, bloc_id: int) -> list[int]:
         all_vals_in_bloc : list[int] = []
-        for (row_id, col_id) in Sudoku.get_rows_cols_from_bloc_id(bloc_id):
-            if self.grid[row_id][col_id] > 0:
-                all_vals_in_bloc.append(self.grid[row_id][col_id])
+        for cell_id in self.geometry.blocs[bloc_id]:
+            if self.cells[cell_id] > 0:
+                all_vals_in_bloc.append(self.cells[cell_id])
         return all_vals_in_bloc
     
     def get_vals_in_row(self, row_id: int) -> list[int]:
-        vals_in_row : list[int] = [val for val in self.grid[row_id] if val > 0]
+        vals_in_row : list[int] = [self.cells[cell_id] for cell_id in self.geometry.rows[row_id] if self.cells[cell_id] > 0]
         return vals_in_row
     
     def get_empty_cell_count(self) -> int:
-        return sum([val == 0 for val in sum(self.grid, [])])
+        return self.nb_empty_cells
 
     
     def get_vals_in_col(self, col_id: int) -> list[int]:
-        vals_in_col : list[int] = [val for val in [self.grid[row_id][col_id] for row_id in range(9)] if val > 0]
+        vals_in_col : list[int] = [self.cells[cell_id] for cell_id in self.geometry.cols[col_id] if self.cells[cell_id] > 0]
         return vals_in_col
     
+    def get_used_mask(self, row_id: int, col_id: int) -> int:
+        """
+            Bit (val - 1) is set when val is already in the row, the col or the bloc of the cell
+        """
+        return self.row_masks[row_id] | self.col_masks[col_id] | self.bloc_masks[self.geometry.bloc_of_cell[self.size * row_id + col_id]]
+
+    def get_allowed_mask(self, row_id: int, col_id: int) -> int:
+        """
+            Bit (val - 1) is set when val is allowed in the cell (neither used by a peer nor eliminated)
+        """
+        return self.geometry.all_values_mask & ~(self.get_used_mask(row_id, col_id) | self.eliminated_masks.get(self.size * row_id + col_id, 0))
+
     def get_allowed_values(self, row_id: int, col_id: int) -> list[int]:
-        assert self.grid[row_id][col_id] == 0
-        allowed_values : list[int] = list(range(1, 10))
-        in_same_row  : list[int] = self.get_vals_in_row(row_id)
-        in_same_col  : list[int] = self.get_vals_in_col(col_id)
-        in_same_bloc : list[int] = self.get_vals_in_bloc(self.get_bloc_id(row_id, col_id))
-        return [val for val in allowed_values if (val not in in_same_row) and (val not in in_same_col) and (val not in in_same_bloc)]
+        cell_id = self.size * row_id + col_id
+        assert self.cells[cell_id] == 0
+        return list(self.geometry.allowed_values_from_mask[self.get_used_mask(row_id, col_id) | self.eliminated_masks.get(cell_id, 0)])
     
     def get_updates_from_allowed_values(self) -> list[tuple[int, int, int]]:
         """
             (row_id, col_id, val_found)
         """
         updates : list[tuple[int, int, int]] = []
-        for row_id in range(9):
-            for col_id in [c_id for c_id in range(9) if self.grid[row_id][c_id] == 0]:
-                allowed_vals = self.get_allowed_values(row_id, col_id)
-                if len(allowed_vals) == 1:
-                    updates.append((row_id, col_id, allowed_vals[0]))
-        return list(set(updates))
+        size = self.size
+        for cell_id in range(self.geometry.nb_cells):
+            if self.cells[cell_id] == 0:
+                allowed_mask = self.get_allowed_mask(cell_id // size, cell_id % size)
+                if allowed_mask and allowed_mask & (allowed_mask - 1) == 0:
+                    updates.append((cell_id // size, cell_id % size, allowed_mask.bit_length()))
+        return updates
 
     @staticmethod
-    def get_bloc_id(row_id: int, col_id: int) -> int:
-        return 3*(row_id // 3) + (col_id // 3)
+    def get_bloc_id(row_id: int, col_id: int, size: int = 9) -> int:
+        return get_geometry(size).bloc_of_cell[size * row_id + col_id]
     
     @staticmethod
-    def get_rows_cols_from_bloc_id(bloc_id: int) -> list[tuple[int, int]]:
-        all_rows_cols : list[tuple[int, int]] = []
-        for row_id in range(9):
-            for col_id in range(9):
-                if Sudoku.get_bloc_id(row_id, col_id) == bloc_id:
-                    all_rows_cols.append((row_id, col_id))
-        return all_rows_cols
+    def get_rows_cols_from_bloc_id(bloc_id: int, size: int = 9) -> tuple[tuple[int, int], ...]:
+        return get_geometry(size).bloc_rows_cols[bloc_id]
     
     def build_detection_grid(self, val: int) -> list[list[bool]]:
-        detection_grid : list[list[bool]] = [[False for __ in range(9)] for _ in range(9)]
-        for row_id in range(9):
-            for col_id in [c_id for c_id in range(9) if self.grid[row_id][c_id] == val]:
-                detection_grid[row_id][col_id] = True
-        return detection_grid
+        size = self.size
+        return [[self.cells[size * row_id + col_id] == val for col_id in range(size)] for row_id in range(size)]
 
     def build_extrapolation_grid(self, val: int) -> list[list[bool]]:
-        detection_grid: list[list[bool]] = self.build_detection_grid(val)
-        extrapolation_grid: list[list[bool]] = [[False for __ in range(9)] for _ in range(9)]
-
-        # Line Check
-        for row_id, row in enumerate(detection_grid):
-            if sum(row) == 1:
-                for col_id in range(9):
-                    extrapolation_grid[row_id][col_id] = True
-        
-        # Col Check
-        for col_id in range(9):
-            col = [detection_grid[row_id][col_id] for row_id in range(9)]
-            if sum(col) == 1:
-                for row_id in range(9):
-                    extrapolation_grid[row_id][col_id] = True
-        
-        # Bloc Check
-        for bloc_id in range(9):
-            all_rowscols_in_bloc = Sudoku.get_rows_cols_from_bloc_id(bloc_id)
-            detecgrid_vals_in_bloc = [detection_grid[row_id][col_id] for (row_id, col_id) in all_rowscols_in_bloc]
-            if sum(detecgrid_vals_in_bloc) == 1:
-                for (row_id, col_id) in all_rowscols_in_bloc:
-                    extrapolation_grid[row_id][col_id] = True
-        
-        extrapolation_grid = [[extrapolation_grid[row_id][col_id] or (self.grid[row_id][col_id] > 0) for col_id in range(9)] for row_id in range(9)]
-
+        """
+            extrapolation_grid[row_id][col_id] is True when the cell is covered for val: filled, val already in its row,
+            col or bloc (read on the masks, so it is linear in the number of cells), or val ruled out of the cell
+        """
+        size = self.size
+        bit = 1 << (val - 1)
+        bloc_of_cell = self.geometry.bloc_of_cell
+        covered_blocs : list[bool] = [bloc_mask & bit > 0 for bloc_mask in self.bloc_masks]
+        covered_cols : list[bool] = [col_mask & bit > 0 for col_mask in self.col_masks]
+        extrapolation_grid : list[list[bool]] = []
+        for row_id in range(size):
+            if self.row_masks[row_id] & bit:
+                extrapolation_grid.append([True] * size)
+                continue
+            extrapolation_grid.append([
+                covered_cols[col_id] or covered_blocs[bloc_of_cell[cell_id]] or self.cells[cell_id] > 0 or self.eliminated_masks.get(cell_id, 0) & bit > 0
+                for col_id, cell_id in enumerate(range(size * row_id, size * (row_id + 1)))
+            ])
         return extrapolation_grid
 
     def get_updates_from_extrapolation_grid(self, extrapolation_grid: list[list[bool]], val : int) -> list[tuple[int, int, int]]:
@@ -117,15 +477,15 @@ class Sudoku:
                 all_updates.append((row_id, col_id, val))
         
         # Check for col updates
-        for col_id in range(9):
-            col = [extrapolation_grid[row_id][col_id] for row_id in range(9)]
+        for col_id in range(self.size):
+            col = [extrapolation_grid[row_id][col_id] for row_id in range(self.size)]
             if len(col) == sum(col) + 1:
                 row_id = [i for i, b in enumerate(col) if not b][0]
                 all_updates.append((row_id, col_id, val))
         
         # Check for bloc updates
-        for bloc_id in range(9):
-            all_rowscols_in_bloc = Sudoku.get_rows_cols_from_bloc_id(bloc_id)
+        for bloc_id in range(self.size):
+            all_rowscols_in_bloc = self.geometry.bloc_rows_cols[bloc_id]
             extrapolation_in_bloc = [extrapolation_grid[row_id][col_id] for (row_id, col_id) in all_rowscols_in_bloc]
             if len(extrapolation_in_bloc) == sum(extrapolation_in_bloc) + 1:
                 index_of_rowscols = [i for i, b in enumerate(extrapolation_in_bloc) if not b][0]
@@ -135,25 +495,470 @@ class Sudoku:
         return list(set(all_updates))
     
     def get_updates_from_extrapolation(self) -> list[tuple[int, int, int]]:
-        all_updates_from_extrapolation : list[tuple[int, int, int]] = []
-        for val in range(1, 10):
-            egrid_val = self.build_extrapolation_grid(val)
-            updates_val = self.get_updates_from_extrapolation_grid(egrid_val, val)
-            all_updates_from_extrapolation.extend(updates_val)
-        return list(set(all_updates_from_extrapolation))
+        """
+            get_updates_from_extrapolation_grid for all the values at once: a cell is the only uncovered cell of a unit
+            for val when val is allowed in no other cell of the unit, so each unit is scanned once on the allowed masks
+        """
+        size = self.size
+        allowed_masks : list[int] = [self.get_allowed_mask(cell_id // size, cell_id % size) if val == 0 else 0 for cell_id, val in enumerate(self.cells)]
+        all_updates_from_extrapolation : set[tuple[int, int, int]] = set()
+        for unit in self.geometry.units:
+            seen_once, seen_twice = 0, 0
+            for cell_id in unit:
+                seen_twice |= seen_once & allowed_masks[cell_id]
+                seen_once |= allowed_masks[cell_id]
+            hidden_mask = seen_once & ~seen_twice
+            if not hidden_mask:
+                continue
+            for cell_id in unit:
+                val_bits = allowed_masks[cell_id] & hidden_mask
+                while val_bits:
+                    bit = val_bits & -val_bits
+                    all_updates_from_extrapolation.add((cell_id // size, cell_id % size, bit.bit_length()))
+                    val_bits ^= bit
+        return list(all_updates_from_extrapolation)
     
     def full_update(self) -> bool:
+        return len(self._full_update_round()) > 0
+
+    def _full_update_round(self) -> list[tuple[int, int, int]]:
+        stats = self.stats
+        if stats is not None:
+            start = perf_counter()
         from_allowed : list[tuple[int, int, int]] = self.get_updates_from_allowed_values()
+        if stats is not None:
+            middle = perf_counter()
         from_extrapol : list[tuple[int, int, int]] = self.get_updates_from_extrapolation()
         all_updates = list(set(from_allowed + from_extrapol))
         for (row_id, col_id, val) in all_updates:
-            self.grid[row_id][col_id] = val
-        return len(all_updates) > 0
+            self.set_value(row_id, col_id, val)
+        if stats is not None:
+            stats.record(ALLOWED, len(from_allowed), middle - start)
+            # Only the cells that the allowed values pass did not already find
+            stats.record(EXTRAPOLATION, len(all_updates) - len(from_allowed), perf_counter() - middle)
+        return all_updates
+
+    def eliminate(self, row_id: int, col_id: int, val: int) -> bool:
+        """
+            Rules val out of the empty cell, returns False if it was already not allowed there
+        """
+        cell_id = self.size * row_id + col_id
+        bit = 1 << (val - 1)
+        if self.cells[cell_id] > 0 or not self.get_allowed_mask(row_id, col_id) & bit:
+            return False
+        self.eliminated_masks[cell_id] = self.eliminated_masks.get(cell_id, 0) | bit
+        return True
+
+    def apply_locked_candidates(self) -> list[tuple[int, int, int]]:
+        """
+            Stuck position pass (locked candidates), the eliminations are kept in eliminated_masks
+            - pointing: if val can only be in one line of a bloc, it is ruled out of the rest of the line
+            - box-line reduction: if val can only be in one bloc of a line, it is ruled out of the rest of the bloc
+            Returns the new (row_id, col_id, val_eliminated)
+        """
+        return [(step.row_id, step.col_id, step.val) for step in self._apply_locked_candidates()]
+
+    def _apply_locked_candidates(self) -> list[Step]:
+        """
+            apply_locked_candidates, the eliminations as ELIMINATION steps whose unit_id is the bloc (pointing)
+            or the line (box-line reduction) where val is locked, and whose covered cells are the segment it is locked in
+        """
+        size, box_size, geometry = self.size, self.geometry.box_size, self.geometry
+        allowed_masks : list[int] = [self.get_allowed_mask(cell_id // size, cell_id % size) if val == 0 else 0 for cell_id, val in enumerate(self.cells)]
+        segment_masks : list[int] = [0] * len(geometry.segments)
+        for seg_id, segment in enumerate(geometry.segments):
+            for cell_id in segment:
+                segment_masks[seg_id] |= allowed_masks[cell_id]
+
+        # (cells, bits) to rule out of the cells, (unit_id, seg_id) where the bits are locked
+        to_eliminate : list[tuple[tuple[int, ...], int, int, int]] = []
+        for bloc_id in range(size):
+            for seg_ids in geometry.bloc_segments[bloc_id]:
+                for seg_id in seg_ids:
+                    others_mask = 0
+                    for other_seg_id in seg_ids:
+                        if other_seg_id != seg_id:
+                            others_mask |= segment_masks[other_seg_id]
+                    to_eliminate.append((geometry.segment_line_rests[seg_id], segment_masks[seg_id] & ~others_mask, 2 * size + bloc_id, seg_id))
+        for line_id in range(2 * size):
+            seg_ids = range(box_size * line_id, box_size * line_id + box_size)
+            for seg_id in seg_ids:
+                others_mask = 0
+                for other_seg_id in seg_ids:
+                    if other_seg_id != seg_id:
+                        others_mask |= segment_masks[other_seg_id]
+                to_eliminate.append((geometry.segment_bloc_rests[seg_id], segment_masks[seg_id] & ~others_mask, line_id, seg_id))
+
+        eliminations : list[Step] = []
+        for cells, bits, unit_id, seg_id in to_eliminate:
+            for cell_id in cells:
+                for val in geometry.allowed_values_from_mask[geometry.all_values_mask & ~(allowed_masks[cell_id] & bits)]:
+                    if self.eliminate(cell_id // size, cell_id % size, val):
+                        eliminations.append(Step(ELIMINATION, cell_id // size, cell_id % size, val, unit_id, geometry.segments[seg_id]))
+        return eliminations
+
+    def get_updates_from_stuck_position(self, eliminations: list[tuple[int, int, int]] | None = None) -> list[tuple[int, int, int]]:
+        """
+            (row_id, col_id, val_found) for the cells left with a single allowed value by the eliminations
+            (by default those of a new apply_locked_candidates)
+        """
+        if eliminations is None:
+            eliminations = self.apply_locked_candidates()
+        updates : list[tuple[int, int, int]] = []
+        for (row_id, col_id) in set((row_id, col_id) for (row_id, col_id, _) in eliminations):
+            allowed_vals = self.get_allowed_values(row_id, col_id)
+            if len(allowed_vals) == 1:
+                updates.append((row_id, col_id, allowed_vals[0]))
+        return updates
+
+    def stuck_position_update(self) -> bool:
+        """
+            Applies the stuck position pass, returns True if it ruled out or found any value
+        """
+        return self._stuck_position_round() is not None
+
+    def _stuck_position_round(self) -> list[tuple[int, int, int]] | None:
+        """
+            Applies the stuck position pass, returns the values found, None if it ruled out nothing
+        """
+        if self.stats is not None:
+            start = perf_counter()
+        eliminations = self.apply_locked_candidates()
+        updates : list[tuple[int, int, int]] = []
+        for (row_id, col_id, val) in self.get_updates_from_stuck_position(eliminations):
+            if self.cells[self.size * row_id + col_id] == 0:
+                self.set_value(row_id, col_id, val)
+                updates.append((row_id, col_id, val))
+        if self.stats is not None:
+            self.stats.record(STUCK_POSITION, len(updates), perf_counter() - start, len(eliminations))
+        return updates if eliminations else None
+
+    def propagate(self) -> list[tuple[int, int, int]]:
+        """
+            Event driven update_while_possible: reaches the same grid, but after the first pass only the
+            peers and the units of the cells that have just been set are checked again.
+            Returns the (row_id, col_id, val_found) updates in the order they were made.
+            The naked singles are recorded in stats as ALLOWED, the hidden singles as EXTRAPOLATION.
+        """
+        if self.stats is not None:
+            start = perf_counter()
+            # Time and updates of the naked singles checks, the rest goes to the hidden singles ones
+            allowed_seconds, nb_allowed_updates = 0.0, 0
+        size, units, peers, units_of_cell = self.size, self.geometry.units, self.geometry.peers, self.geometry.units_of_cell
+        updates : list[tuple[int, int, int]] = []
+        cells_to_check : deque[int] = deque(cell_id for cell_id, val in enumerate(self.cells) if val == 0)
+        units_to_check : deque[int] = deque(range(len(units)))
+        cell_is_queued : list[bool] = [val == 0 for val in self.cells]
+        unit_is_queued : list[bool] = [True] * len(units)
+
+        def place(cell_id: int, val: int):
+            row_id, col_id = divmod(cell_id, size)
+            self.set_value(row_id, col_id, val)
+            updates.append((row_id, col_id, val))
+            # val is no longer allowed in the empty peers, which may create singles in them and in their units
+            for peer_id in peers[cell_id]:
+                if self.cells[peer_id] > 0:
+                    continue
+                if not cell_is_queued[peer_id]:
+                    cell_is_queued[peer_id] = True
+                    cells_to_check.append(peer_id)
+                for unit_id in units_of_cell[peer_id]:
+                    if not unit_is_queued[unit_id]:
+                        unit_is_queued[unit_id] = True
+                        units_to_check.append(unit_id)
+
+        while cells_to_check or units_to_check:
+            # Naked singles first, they are the cheapest to check
+            if cells_to_check:
+                cell_id = cells_to_check.popleft()
+                cell_is_queued[cell_id] = False
+                if self.cells[cell_id] > 0:
+                    continue
+                if self.stats is not None:
+                    check_start = perf_counter()
+                allowed_mask = self.get_allowed_mask(cell_id // size, cell_id % size)
+                if allowed_mask and allowed_mask & (allowed_mask - 1) == 0:
+                    place(cell_id, allowed_mask.bit_length())
+                    if self.stats is not None:
+                        nb_allowed_updates += 1
+                if self.stats is not None:
+                    allowed_seconds += perf_counter() - check_start
+                continue
+
+            # Hidden singles: values allowed in exactly one empty cell of the unit
+            unit_id = units_to_check.popleft()
+            unit_is_queued[unit_id] = False
+            allowed_masks : dict[int, int] = {cell_id: self.get_allowed_mask(cell_id // size, cell_id % size) for cell_id in units[unit_id] if self.cells[cell_id] == 0}
+            seen_once, seen_twice = 0, 0
+            for allowed_mask in allowed_masks.values():
+                seen_twice |= seen_once & allowed_mask
+                seen_once |= allowed_mask
+            hidden_mask = seen_once & ~seen_twice
+            for cell_id, allowed_mask in allowed_masks.items():
+                val_bits = allowed_mask & hidden_mask
+                if val_bits and self.cells[cell_id] == 0:
+                    place(cell_id, (val_bits & -val_bits).bit_length())
+        if self.stats is not None:
+            self.stats.record(ALLOWED, nb_allowed_updates, allowed_seconds)
+            self.stats.record(EXTRAPOLATION, len(updates) - nb_allowed_updates, perf_counter() - start - allowed_seconds)
+        return updates
+
+    def solve(self) -> int:
+        """
+            Exhaustive search (backtracking on the bitmasks, filling the naked and hidden singles at each node)
+            Fills the grid with the first solution found and returns the number of solutions, capped at 2
+            (1 means the solution is unique). The grid is left unchanged when there is no solution.
+        """
+        if self.stats is not None:
+            start = perf_counter()
+        size, bloc_of_cell, allowed_values_from_mask = self.size, self.geometry.bloc_of_cell, self.geometry.allowed_values_from_mask
+        cells : list[int] = list(self.cells)
+        if size > 9:
+            # The bigger boards are searched from what the deductions leave, they hold for any solution.
+            # They run on a copy so that the grid is left unchanged when there is no solution.
+            deduced = Sudoku.from_buffer(bytearray(self.cells))
+            deduced.update_while_possible(show_grid=False, incremental=True)
+            cells = list(deduced.cells)
+        row_masks : list[int] = [0] * size
+        col_masks : list[int] = [0] * size
+        bloc_masks : list[int] = [0] * size
+        empty_cells : list[int] = []
+        for cell_id, val in enumerate(cells):
+            if val == 0:
+                empty_cells.append(cell_id)
+                continue
+            bit = 1 << (val - 1)
+            row_id, col_id, bloc_id = cell_id // size, cell_id % size, bloc_of_cell[cell_id]
+            if (row_masks[row_id] | col_masks[col_id] | bloc_masks[bloc_id]) & bit:
+                return 0
+            row_masks[row_id] |= bit
+            col_masks[col_id] |= bit
+            bloc_masks[bloc_id] |= bit
 
-    def update_while_possible(self, show_grid : bool = True):
-        has_been_updated : bool = True
+        solutions : list[list[int]] = []
+        units, all_values_mask = self.geometry.units, self.geometry.all_values_mask
+        unit_masks : tuple[list[int], list[int], list[int]] = (row_masks, col_masks, bloc_masks)
+
+        def fill(nb_filled: int, cell_id: int, val: int):
+            """
+                Puts val in cell_id, which takes the place nb_filled of empty_cells
+            """
+            pos = empty_cells.index(cell_id, nb_filled)
+            empty_cells[nb_filled], empty_cells[pos] = empty_cells[pos], empty_cells[nb_filled]
+            bit = 1 << (val - 1)
+            cells[cell_id] = val
+            row_masks[cell_id // size] |= bit
+            col_masks[cell_id % size] |= bit
+            bloc_masks[bloc_of_cell[cell_id]] |= bit
+
+        def empty(start: int, nb_filled: int):
+            """
+                Empties again the cells of empty_cells[start:nb_filled]
+            """
+            for pos in range(start, nb_filled):
+                cell_id = empty_cells[pos]
+                bit = 1 << (cells[cell_id] - 1)
+                cells[cell_id] = 0
+                row_masks[cell_id // size] ^= bit
+                col_masks[cell_id % size] ^= bit
+                bloc_masks[bloc_of_cell[cell_id]] ^= bit
+
+        def search(nb_filled: int) -> bool:
+            """
+                empty_cells[:nb_filled] are already filled, returns True once 2 solutions are found
+                The naked and hidden singles are filled first, then the search branches on the cell with the fewest
+                values, or on the 2 places of a val in a unit when that cell has more than 2 values.
+                The grid is restored before returning.
+            """
+            start = nb_filled
+            while True:
+                # Naked singles, and the cell with the fewest values
+                allowed_masks : dict[int, int] = {}
+                best_cell_id, best_count = -1, size + 1
+                for cell_id in empty_cells[nb_filled:]:
+                    allowed_mask = all_values_mask & ~(row_masks[cell_id // size] | col_masks[cell_id % size] | bloc_masks[bloc_of_cell[cell_id]])
+                    if allowed_mask & (allowed_mask - 1) == 0:
+                        if allowed_mask == 0:
+                            empty(start, nb_filled)
+                            return False
+                        fill(nb_filled, cell_id, allowed_mask.bit_length())
+                        nb_filled += 1
+                        best_count = 0
+                    elif best_count > 0:
+                        allowed_masks[cell_id] = allowed_mask
+                        count = allowed_mask.bit_count()
+                        if count < best_count:
+                            best_cell_id, best_count = cell_id, count
+                if best_count == 0:
+                    continue
+                if nb_filled == len(empty_cells):
+                    solutions.append(list(cells))
+                    done = len(solutions) >= 2
+                    empty(start, nb_filled)
+                    return done
+
+                # Hidden singles of the first unit that has some, and a val fitting 2 cells of a unit
+                pair_options : list[tuple[int, int]] | None = None
+                for unit_id, unit in enumerate(units):
+                    seen_once, seen_twice, seen_thrice = 0, 0, 0
+                    for cell_id in unit:
+                        allowed_mask = allowed_masks.get(cell_id, 0)
+                        seen_thrice |= seen_twice & allowed_mask
+                        seen_twice |= seen_once & allowed_mask
+                        seen_once |= allowed_mask
+                    if seen_once | unit_masks[unit_id // size][unit_id % size] != all_values_mask:
+                        empty(start, nb_filled)
+                        return False
+                    hidden_mask = seen_once & ~seen_twice
+                    if hidden_mask:
+                        for cell_id in unit:
+                            val_bits = allowed_masks.get(cell_id, 0) & hidden_mask
+                            if val_bits:
+                                fill(nb_filled, cell_id, (val_bits & -val_bits).bit_length())
+                                nb_filled += 1
+                        break
+                    if pair_options is None and best_count > 2:
+                        pair_mask = seen_twice & ~seen_thrice
+                        if pair_mask:
+                            bit = pair_mask & -pair_mask
+                            pair_options = [(cell_id, bit.bit_length()) for cell_id in unit if allowed_masks.get(cell_id, 0) & bit]
+                else:
+                    break
+
+            options = pair_options or [(best_cell_id, val) for val in allowed_values_from_mask[all_values_mask & ~allowed_masks[best_cell_id]]]
+            done = False
+            for cell_id, val in options:
+                fill(nb_filled, cell_id, val)
+                done = search(nb_filled + 1)
+                empty(nb_filled, nb_filled + 1)
+                if done:
+                    break
+            empty(start, nb_filled)
+            return done
+
+        search(0)
+        nb_resolved = 0
+        if solutions:
+            for cell_id, val in enumerate(self.cells):
+                if val == 0:
+                    self.set_value(cell_id // size, cell_id % size, solutions[0][cell_id])
+                    nb_resolved += 1
+        if self.stats is not None:
+            self.stats.record(SEARCH, nb_resolved, perf_counter() - start)
+        return len(solutions)
+
+    def record_trace(self) -> list[Step]:
+        """
+            Solves like MainSudoku (allowed values pass, extrapolation pass if it found nothing,
+            stuck position pass if both found nothing) and returns the steps, so that the scenes only replay them
+        """
+        trace : list[Step] = []
+        has_been_updated = True
         while has_been_updated:
-            has_been_updated = self.full_update()
+            has_been_updated = self._record_pass(ALLOWED, self._record_allowed_values_pass, trace)
+            has_been_updated = has_been_updated or self._record_pass(EXTRAPOLATION, self._record_extrapolation_pass, trace)
+            if not has_been_updated:
+                has_been_updated = self._record_pass(STUCK_POSITION, self._record_stuck_position_pass, trace)
+        return trace
+
+    def replay(self, steps: list[Step]):
+        """
+            Applies the values found and the eliminations of recorded steps, without solving anything
+        """
+        for step in steps:
+            if step.technique == ELIMINATION:
+                self.eliminate(step.row_id, step.col_id, step.val)
+            elif step.technique != COVER and step.val > 0:
+                self.set_value(step.row_id, step.col_id, step.val)
+
+    def _record_pass(self, technique: str, record_pass: Callable[[list[Step]], bool], trace: list[Step]) -> bool:
+        if self.stats is None:
+            return record_pass(trace)
+        start, nb_steps = perf_counter(), len(trace)
+        has_been_updated = record_pass(trace)
+        new_steps = trace[nb_steps:]
+        self.stats.record(technique, sum(1 for step in new_steps if step.technique not in (COVER, ELIMINATION) and step.val > 0),
+                          perf_counter() - start, sum(1 for step in new_steps if step.technique == ELIMINATION))
+        return has_been_updated
+
+    def _record_allowed_values_pass(self, trace: list[Step]) -> bool:
+        has_been_updated = False
+        for row_id in range(self.size):
+            for col_id in [c_id for c_id in range(self.size) if self.cells[self.size * row_id + c_id] == 0]:
+                allowed_vals = self.get_allowed_values(row_id, col_id)
+                if len(allowed_vals) == 1:
+                    self.set_value(row_id, col_id, allowed_vals[0])
+                    has_been_updated = True
+                trace.append(Step(ALLOWED, row_id, col_id, allowed_vals[0] if len(allowed_vals) == 1 else 0))
+        return has_been_updated
+
+    def _record_extrapolation_pass(self, trace: list[Step]) -> bool:
+        has_been_updated = False
+        size = self.size
+        for val in range(1, size + 1):
+            if all(row_mask >> (val - 1) & 1 for row_mask in self.row_masks):
+                continue
+            egrid = self.build_extrapolation_grid(val)
+            covered = [is_covered for row in egrid for is_covered in row]
+            trace.append(Step(COVER, val=val, covered=tuple(cell_id for cell_id, is_covered in enumerate(covered) if is_covered)))
+            # The units are checked on the extrapolation grid built before the updates, as in get_updates_from_extrapolation_grid
+            for unit_id, unit in enumerate(self.geometry.units):
+                uncovered = [cell_id for cell_id in unit if not covered[cell_id]]
+                if len(uncovered) == 1 and self.cells[uncovered[0]] == 0:
+                    row_id, col_id = divmod(uncovered[0], size)
+                    self.set_value(row_id, col_id, val)
+                    trace.append(Step(EXTRAPOLATION, row_id, col_id, val, unit_id))
+                    has_been_updated = True
+        return has_been_updated
+
+    def _record_stuck_position_pass(self, trace: list[Step]) -> bool:
+        elimination_steps = self._apply_locked_candidates()
+        trace.extend(elimination_steps)
+        # A value found is supported by the last elimination in its cell
+        last_elimination_steps : dict[tuple[int, int], Step] = {(step.row_id, step.col_id): step for step in elimination_steps}
+        eliminations = [(step.row_id, step.col_id, step.val) for step in elimination_steps]
+        for (row_id, col_id, val) in self.get_updates_from_stuck_position(eliminations):
+            if self.cells[self.size * row_id + col_id] == 0:
+                self.set_value(row_id, col_id, val)
+                elimination_step = last_elimination_steps[(row_id, col_id)]
+                trace.append(Step(STUCK_POSITION, row_id, col_id, val, elimination_step.unit_id, elimination_step.covered))
+        return len(eliminations) > 0
+
+    def iter_updates(self, incremental : bool = False, use_stuck_position : bool = True) -> Iterator[list[tuple[int, int, int]]]:
+        """
+            Generator version of update_while_possible: yields the (row_id, col_id, val_found) updates of each round,
+            once they are applied to the grid, and returns when a round finds and rules out nothing.
+            A stuck position round that only ruled out values yields an empty list.
+        """
+        if incremental:
+            updates = self.propagate()
+            if updates:
+                yield updates
+            while use_stuck_position:
+                updates = self._stuck_position_round()
+                if updates is None:
+                    return
+                yield updates + self.propagate()
+            return
+        while True:
+            updates = self._full_update_round()
+            if not updates:
+                if not use_stuck_position:
+                    return
+                updates = self._stuck_position_round()
+                if updates is None:
+                    return
+            yield updates
+
+    def update_while_possible(self, show_grid : bool = True, incremental : bool = False, use_stuck_position : bool = True, delay : float = 1.0):
+        """
+            Applies full_update until it finds nothing, then the stuck position pass (like MainSudoku) as long as it rules out values
+            With show_grid the grid is printed after each round, delay seconds apart (use iter_updates to follow the rounds without blocking),
+            the rounds of incremental being a propagate then a stuck position pass followed by a propagate each
+        """
+        for _ in self.iter_updates(incremental, use_stuck_position):
             if show_grid:
                 print(self)
-                sleep(1)
\ No newline at end of file
+                sleep(delay)
+        if show_grid:
+            print(self)
\ No newline at end of file
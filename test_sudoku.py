@@ -0,0 +1,234 @@
+"""
+    Regression checks of the incremental deductions against the full rescans (run with pytest)
+"""
+import random
+import pytest
+from bench import CORPORA
+from sudoku import Sudoku, get_geometry, ELIMINATION, STUCK_POSITION
+import vectorized
+from canonical import CanonicalCache, canonicalize
+
+def get_solutions() -> list[str]:
+    """
+        The solutions of the bench corpora, and a 4 x 4 and a 16 x 16 solved grid
+    """
+    rng = random.Random(0)
+    solutions : list[str] = []
+    for puzzle in (puzzle for corpus in CORPORA.values() for puzzle in corpus):
+        sudoku = Sudoku.from_string(puzzle)
+        sudoku.solve()
+        solutions.append(sudoku.to_string())
+    for size in (4, 16):
+        # Rows shifted by box_size in a band and by 1 from a band to the next, then relabelled
+        box_size = {4: 2, 16: 4}[size]
+        relabel = rng.sample(range(1, size + 1), size)
+        sudoku = Sudoku(grid=[[relabel[(box_size * (row_id % box_size) + row_id // box_size + col_id) % size] for col_id in range(size)] for row_id in range(size)])
+        solutions.append(sudoku.to_string())
+    return solutions
+
+SOLUTIONS = get_solutions()
+
+def get_puzzles() -> list[str]:
+    """
+        The bench corpora, and partial grids of SOLUTIONS
+    """
+    rng = random.Random(0)
+    puzzles = [puzzle for corpus in CORPORA.values() for puzzle in corpus]
+    for solution in SOLUTIONS:
+        for _ in range(5):
+            cells = list(solution)
+            for cell_id in rng.sample(range(len(cells)), rng.randint(len(cells) // 3, 3 * len(cells) // 4)):
+                cells[cell_id] = "0"
+            puzzles.append("".join(cells))
+    return puzzles
+
+PUZZLES = get_puzzles()
+
+@pytest.mark.parametrize("puzzle", PUZZLES)
+def test_propagate_matches_full_update(puzzle: str):
+    expected = Sudoku.from_string(puzzle)
+    expected.update_while_possible(show_grid=False, incremental=False, use_stuck_position=False)
+    sudoku = Sudoku.from_string(puzzle)
+    sudoku.propagate()
+    assert sudoku.to_string() == expected.to_string()
+
+@pytest.mark.parametrize("puzzle", PUZZLES)
+def test_incremental_update_while_possible(puzzle: str):
+    expected = Sudoku.from_string(puzzle)
+    expected.update_while_possible(show_grid=False, incremental=False)
+    sudoku = Sudoku.from_string(puzzle)
+    sudoku.update_while_possible(show_grid=False, incremental=True)
+    assert sudoku.to_string() == expected.to_string()
+
+def is_solution(sudoku: Sudoku, puzzle: str) -> bool:
+    return sudoku.get_empty_cell_count() == 0 and \
+        all(sorted(sudoku.cells[cell_id] for cell_id in unit) == list(range(1, sudoku.size + 1)) for unit in sudoku.geometry.units) and \
+        all(val == "0" or int(val) == sudoku.cells[cell_id] for cell_id, val in enumerate(puzzle))
+
+def has_conflict(cells: list[int], size: int) -> bool:
+    """
+        Whether a value is given twice in a row, col or bloc
+    """
+    box_size = int(size ** 0.5)
+    units = [range(size * row_id, size * row_id + size) for row_id in range(size)] + \
+            [range(col_id, size * size, size) for col_id in range(size)] + \
+            [[size * (bloc_row_id + r_id) + bloc_col_id + c_id for r_id in range(box_size) for c_id in range(box_size)]
+             for bloc_row_id in range(0, size, box_size) for bloc_col_id in range(0, size, box_size)]
+    for unit in units:
+        vals = [cells[cell_id] for cell_id in unit if cells[cell_id]]
+        if len(vals) != len(set(vals)):
+            return True
+    return False
+
+@pytest.mark.parametrize("puzzle", PUZZLES)
+def test_stuck_position_steps_supported(puzzle: str):
+    sudoku = Sudoku.from_string(puzzle)
+    geometry = sudoku.geometry
+    for step in sudoku.record_trace():
+        if step.technique in (ELIMINATION, STUCK_POSITION):
+            # The covered segment is in the supporting unit, the cell is outside of it but in another unit of the segment
+            cell_id = sudoku.size * step.row_id + step.col_id
+            segment_unit_ids = set.intersection(*(set(geometry.units_of_cell[covered_id]) for covered_id in step.covered))
+            assert step.unit_id in segment_unit_ids and cell_id not in step.covered
+            assert set(geometry.units_of_cell[cell_id]) & (segment_unit_ids - {step.unit_id})
+
+@pytest.mark.parametrize("puzzle", [puzzle for puzzle in PUZZLES if len(puzzle) == 81])
+def test_vectorized_extrapolation_with_eliminations(puzzle: str):
+    sudoku = Sudoku.from_string(puzzle)
+    for _ in range(3):
+        assert sorted(vectorized.get_updates_from_extrapolation(sudoku)) == sorted(sudoku.get_updates_from_extrapolation())
+        sudoku.apply_locked_candidates()
+
+def count_solutions(cells: list[int], size: int, max_count: int = 2) -> int:
+    """
+        Brute force: tries every value in the first empty cell, up to max_count solutions (the clues must not conflict)
+    """
+    box_size = int(size ** 0.5)
+    if 0 not in cells:
+        return 1
+    cell_id = cells.index(0)
+    row_id, col_id = divmod(cell_id, size)
+    bloc_row_id, bloc_col_id = row_id - row_id % box_size, col_id - col_id % box_size
+    used = set(cells[size * row_id:size * row_id + size]) | set(cells[col_id::size]) | {
+        cells[size * r_id + c_id] for r_id in range(bloc_row_id, bloc_row_id + box_size) for c_id in range(bloc_col_id, bloc_col_id + box_size)
+    }
+    count = 0
+    for val in range(1, size + 1):
+        if val not in used:
+            cells[cell_id] = val
+            count += count_solutions(cells, size, max_count - count)
+            cells[cell_id] = 0
+            if count >= max_count:
+                break
+    return count
+
+def get_search_puzzles() -> list[str]:
+    """
+        Partial grids of the 4 x 4 and 9 x 9 SOLUTIONS, few enough cells emptied for the brute force:
+        with a unique solution, with several (all the cells of a 4 x 4 grid, or a deadly rectangle of a 9 x 9 one),
+        with a clue conflicting with a peer, and with a clue leaving no solution without any conflict
+    """
+    rng = random.Random(1)
+    puzzles = ["0" * 16, "0" * 81]
+    for solution in [solution for solution in SOLUTIONS if len(solution) <= 81]:
+        size = int(len(solution) ** 0.5)
+        for _ in range(3):
+            cells = list(solution)
+            for cell_id in rng.sample(range(len(cells)), rng.randint(len(cells) // 3, len(cells) // 2)):
+                cells[cell_id] = "0"
+            puzzles.append("".join(cells))
+            # A clue set to the value of a filled peer, and one set to the value of a peer of the solution
+            empty_cell_ids = [cell_id for cell_id, val in enumerate(cells) if val == "0"]
+            cell_id = rng.choice(empty_cell_ids)
+            row_id = cell_id // size
+            peer_ids = [size * row_id + col_id for col_id in range(size) if size * row_id + col_id != cell_id]
+            filled_peer_id = next((peer_id for peer_id in peer_ids if cells[peer_id] != "0"), None)
+            if filled_peer_id is not None:
+                puzzles.append("".join(cells[:cell_id] + [cells[filled_peer_id]] + cells[cell_id + 1:]))
+            empty_peer_id = next((peer_id for peer_id in peer_ids if cells[peer_id] == "0"), None)
+            if empty_peer_id is not None:
+                puzzles.append("".join(cells[:cell_id] + [solution[empty_peer_id]] + cells[cell_id + 1:]))
+        if size == 9:
+            # Deadly rectangle: 2 rows of a band and 2 cols of 2 stacks holding the same 2 values crosswise
+            for row_id in range(9):
+                for other_row_id in range(row_id + 1, row_id - row_id % 3 + 3):
+                    for col_id in range(9):
+                        for other_col_id in range(col_id - col_id % 3 + 3, 9):
+                            if solution[9 * row_id + col_id] == solution[9 * other_row_id + other_col_id] and \
+                               solution[9 * row_id + other_col_id] == solution[9 * other_row_id + col_id]:
+                                cells = list(solution)
+                                for r_id in (row_id, other_row_id):
+                                    for c_id in (col_id, other_col_id):
+                                        cells[9 * r_id + c_id] = "0"
+                                puzzles.append("".join(cells))
+    return puzzles
+
+@pytest.mark.parametrize("puzzle", get_search_puzzles())
+def test_solve_counts_solutions(puzzle: str):
+    sudoku = Sudoku.from_string(puzzle)
+    expected = 0 if has_conflict(sudoku.cells, sudoku.size) else count_solutions(list(sudoku.cells), sudoku.size)
+    nb_solutions = sudoku.solve()
+    assert nb_solutions == expected
+    if nb_solutions == 0:
+        assert sudoku.to_string() == puzzle
+    else:
+        assert is_solution(sudoku, puzzle)
+
+def get_variant(puzzle: str, rng: random.Random) -> str:
+    """
+        puzzle with its bands, stacks, rows in bands and cols in stacks permuted, relabelled, and transposed half of the time
+    """
+    rows = [3 * band_id + row_id for band_id in rng.sample(range(3), 3) for row_id in rng.sample(range(3), 3)]
+    cols = [3 * stack_id + col_id for stack_id in rng.sample(range(3), 3) for col_id in rng.sample(range(3), 3)]
+    relabel = ["0"] + [str(val) for val in rng.sample(range(1, 10), 9)]
+    variant = [relabel[int(puzzle[9 * row_id + col_id])] for row_id in rows for col_id in cols]
+    if rng.random() < 0.5:
+        variant = [variant[9 * (cell_id % 9) + cell_id // 9] for cell_id in range(81)]
+    return "".join(variant)
+
+CANONICAL_PUZZLES = [puzzle for puzzle in PUZZLES if len(puzzle) == 81][::3]
+
+@pytest.mark.parametrize("puzzle", CANONICAL_PUZZLES)
+def test_canonicalize_variants(puzzle: str):
+    rng = random.Random(puzzle)
+    cells = bytes(Sudoku.from_string(puzzle).cells)
+    canonical_form = canonicalize(cells)
+    if canonical_form is not None:
+        canonical, symmetry = canonical_form
+        assert symmetry.apply(cells) == canonical and symmetry.invert(canonical) == cells
+    for _ in range(3):
+        variant_cells = bytes(Sudoku.from_string(get_variant(puzzle, rng)).cells)
+        variant_canonical_form = canonicalize(variant_cells)
+        assert (variant_canonical_form is None) == (canonical_form is None)
+        if canonical_form is not None:
+            assert variant_canonical_form[0] == canonical_form[0]
+            assert variant_canonical_form[1].apply(variant_cells) == canonical_form[0]
+
+@pytest.mark.parametrize("puzzle", CANONICAL_PUZZLES)
+def test_canonical_cache_variants(puzzle: str):
+    rng = random.Random(puzzle)
+    cache = CanonicalCache(min_compute_seconds=0)
+    for variant in [puzzle] + [get_variant(puzzle, rng) for _ in range(3)]:
+        expected, sudoku = Sudoku.from_string(variant), Sudoku.from_string(variant)
+        nb_solutions = cache.solve(sudoku)
+        assert nb_solutions == expected.solve()
+        # With several solutions, the one copied through the symmetry may not be the first one found on variant
+        if nb_solutions == 2:
+            assert is_solution(sudoku, variant)
+        else:
+            assert sudoku.to_string() == expected.to_string()
+        expected, sudoku = Sudoku.from_string(variant), Sudoku.from_string(variant)
+        expected.update_while_possible(show_grid=False, incremental=True)
+        cache.update_while_possible(sudoku)
+        assert sudoku.to_string() == expected.to_string()
+    if canonicalize(Sudoku.from_string(puzzle).cells) is not None:
+        assert cache.hits == 6
+
+@pytest.mark.parametrize("puzzle", CANONICAL_PUZZLES)
+def test_canonicalize_invalid(puzzle: str):
+    # A clue given again in its row, col or bloc
+    cells = bytearray(Sudoku.from_string(puzzle).cells)
+    cell_id = next(cell_id for cell_id, val in enumerate(cells) if val > 0)
+    peer_id = next(peer_id for peer_id in get_geometry(9).peers[cell_id] if cells[peer_id] == 0)
+    cells[peer_id] = cells[cell_id]
+    assert canonicalize(cells) is None
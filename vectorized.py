@@ -0,0 +1,129 @@
+"""
+    NumPy versions of the Sudoku deductions, all values handled at once
+"""
+from typing import Iterable
+import numpy as np
+from sudoku import Sudoku
+
+def to_array(sudoku: Sudoku) -> np.ndarray:
+    assert sudoku.size == 9, f"Only the 9 x 9 boards are vectorized, got a size of {sudoku.size}"
+    return np.frombuffer(sudoku.cells, dtype=np.uint8).reshape(9, 9).astype(np.int8)
+
+def to_eliminated_tensor(sudoku: Sudoku) -> np.ndarray:
+    """
+        eliminated[val - 1, row_id, col_id] is True when val has been ruled out of the cell (Sudoku.eliminated_masks)
+    """
+    eliminated = np.zeros((9, 81), dtype=bool)
+    for cell_id, mask in sudoku.eliminated_masks.items():
+        eliminated[:, cell_id] = (mask >> np.arange(9)) & 1 > 0
+    return eliminated.reshape(9, 9, 9)
+
+def to_arrays(puzzles: Iterable[str]) -> np.ndarray:
+    """
+        Stacks 81 char puzzles ('0' or '.' for empty cells) into an (N, 9, 9) uint8 array
+    """
+    buffer = "".join(puzzle.strip().replace(".", "0") for puzzle in puzzles).encode("ascii")
+    return (np.frombuffer(buffer, dtype=np.uint8) - ord("0")).reshape(-1, 9, 9)
+
+def build_detection_tensor(grid: np.ndarray) -> np.ndarray:
+    """
+        detection[..., val - 1, row_id, col_id] is True when grid[..., row_id, col_id] == val
+        grid can be a single (9, 9) grid or a stack of grids (N, 9, 9)
+    """
+    return grid[..., np.newaxis, :, :] == np.arange(1, 10, dtype=grid.dtype)[:, np.newaxis, np.newaxis]
+
+def spread_blocs(bloc_tensor: np.ndarray) -> np.ndarray:
+    """
+        (..., 3, 3) bloc values -> (..., 9, 9) cell values
+    """
+    return np.repeat(np.repeat(bloc_tensor, 3, axis=-2), 3, axis=-1)
+
+def build_extrapolation_tensor(grid: np.ndarray, eliminated: np.ndarray | None = None) -> np.ndarray:
+    """
+        extrapolation[..., val - 1, :, :] is Sudoku.build_extrapolation_grid(val) for the 9 values
+        eliminated is the to_eliminated_tensor of the grid, None when no value has been ruled out
+    """
+    detection = build_detection_tensor(grid)
+    row_check = detection.sum(axis=-1) == 1
+    col_check = detection.sum(axis=-2) == 1
+    bloc_check = detection.reshape(detection.shape[:-2] + (3, 3, 3, 3)).sum(axis=(-3, -1)) == 1
+    extrapolation = (
+        row_check[..., :, np.newaxis]
+        | col_check[..., np.newaxis, :]
+        | spread_blocs(bloc_check)
+        | (grid > 0)[..., np.newaxis, :, :]
+    )
+    if eliminated is not None:
+        extrapolation |= eliminated
+    return extrapolation
+
+def get_updates_from_extrapolation_tensor(extrapolation: np.ndarray) -> list[tuple[int, int, int]]:
+    """
+        Same updates as Sudoku.get_updates_from_extrapolation_grid, for the 9 values at once
+    """
+    uncovered = ~extrapolation
+    all_updates : set[tuple[int, int, int]] = set()
+
+    # Row updates
+    vals, row_ids = np.nonzero(uncovered.sum(axis=2) == 1)
+    col_ids = uncovered[vals, row_ids].argmax(axis=1)
+    all_updates.update(zip(row_ids.tolist(), col_ids.tolist(), (vals + 1).tolist()))
+
+    # Col updates
+    vals, col_ids = np.nonzero(uncovered.sum(axis=1) == 1)
+    row_ids = uncovered[vals, :, col_ids].argmax(axis=1)
+    all_updates.update(zip(row_ids.tolist(), col_ids.tolist(), (vals + 1).tolist()))
+
+    # Bloc updates, blocs[val - 1, bloc_id] lists the 9 cells of the bloc in reading order
+    blocs = uncovered.reshape(9, 3, 3, 3, 3).transpose(0, 1, 3, 2, 4).reshape(9, 9, 9)
+    vals, bloc_ids = np.nonzero(blocs.sum(axis=2) == 1)
+    in_bloc_ids = blocs[vals, bloc_ids].argmax(axis=1)
+    row_ids = 3 * (bloc_ids // 3) + in_bloc_ids // 3
+    col_ids = 3 * (bloc_ids % 3) + in_bloc_ids % 3
+    all_updates.update(zip(row_ids.tolist(), col_ids.tolist(), (vals + 1).tolist()))
+
+    return list(all_updates)
+
+def get_updates_from_extrapolation(sudoku: Sudoku) -> list[tuple[int, int, int]]:
+    """
+        Vectorized Sudoku.get_updates_from_extrapolation
+    """
+    return get_updates_from_extrapolation_tensor(build_extrapolation_tensor(to_array(sudoku), to_eliminated_tensor(sudoku)))
+
+def deduction_round(grids: np.ndarray) -> np.ndarray:
+    """
+        One Sudoku.full_update on each grid of the (N, 9, 9) stack, in place (grids without eliminated candidates)
+        Returns the (N,) mask of the grids that have been updated
+    """
+    # For valid grids, a cell not covered by the extrapolation of val is a cell where val is allowed
+    allowed = ~build_extrapolation_tensor(grids)
+
+    # Naked singles (get_updates_from_allowed_values)
+    found = allowed & (allowed.sum(axis=-3) == 1)[..., np.newaxis, :, :]
+    # Hidden singles in rows, cols and blocs (get_updates_from_extrapolation)
+    found |= allowed & (allowed.sum(axis=-1) == 1)[..., :, np.newaxis]
+    found |= allowed & (allowed.sum(axis=-2) == 1)[..., np.newaxis, :]
+    bloc_counts = allowed.reshape(allowed.shape[:-2] + (3, 3, 3, 3)).sum(axis=(-3, -1))
+    found |= allowed & spread_blocs(bloc_counts == 1)
+
+    found_in_cell = found.any(axis=-3)
+    grids += np.where(found_in_cell, found.argmax(axis=-3) + 1, 0).astype(grids.dtype)
+    return found_in_cell.any(axis=(-2, -1))
+
+def deduce_many(grids: np.ndarray, max_rounds: int | None = None) -> np.ndarray:
+    """
+        Batched Sudoku.update_while_possible(use_stuck_position=False) on an (N, 9, 9) uint8 stack, in place
+        Each round only runs on the grids that were still changing at the previous one.
+        Returns the (N,) number of rounds that updated each grid, a cheap difficulty measure.
+    """
+    nb_rounds = np.zeros(len(grids), dtype=np.int32)
+    active = np.arange(len(grids))
+    while len(active) > 0 and (max_rounds is None or max_rounds > 0):
+        sub_grids = grids[active]
+        changing = deduction_round(sub_grids)
+        grids[active] = sub_grids
+        active = active[changing]
+        nb_rounds[active] += 1
+        if max_rounds is not None:
+            max_rounds -= 1
+    return nb_rounds